@@ -0,0 +1,174 @@
+"""
+Random chess playouts for many positions at once, on NumPy arrays.
+
+The K positions are a (K, 64) int8 array of bitboard piece indices (EMPTY for
+an empty square) in the Position.mailbox layout, with the side to move in a
+(K,) array. Each step picks one random move in every game still going, with
+array operations over all of them, so the Python overhead is per ply and not
+per game.
+
+To stay vectorized the playouts use pseudo-legal moves: a move may leave the
+king in check, and a game ends when a king is captured, won by the capturing
+side. A random piece is picked first and then a random square it can move to;
+a piece without moves is not picked again for that ply, and a side that picks
+one MAX_PICKS times running is treated as stalemated, which rarely happens
+while it has moves.
+"""
+import numpy as np
+
+import bitboard as bb
+
+# Times a side may pick a piece with no moves before its game counts as stalemated
+MAX_PICKS = 8
+
+# Ray directions as square steps, (row, col), rooks' first: N, S, W, E, NW, NE, SW, SE
+_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def _bit_table(table):
+	"""(64, 64) bool array of a bitboard attack table indexed by square."""
+	return np.array([[attacks >> sq & 1 for sq in range(64)] for attacks in table], dtype=bool)
+
+
+def _ray_table():
+	"""(64, 8, 7) squares along each direction from each square, nearest first,
+	padded with 64 (a square off the board) past the edge."""
+	rays = np.full((64, 8, 7), 64, dtype=np.int64)
+	for sq in range(64):
+		row, col = bb.SQUARES[sq]
+		for d, (dr, dc) in enumerate(_DIRECTIONS):
+			for i in range(7):
+				r, c = row + dr * (i + 1), col + dc * (i + 1)
+				if not (0 <= r < 8 and 0 <= c < 8):
+					break
+				rays[sq, d, i] = r * 8 + c
+	return rays
+
+
+KNIGHT_TARGETS = _bit_table(bb.KNIGHT_ATTACKS)
+KING_TARGETS = _bit_table(bb.KING_ATTACKS)
+PAWN_TARGETS = np.stack([_bit_table(bb.PAWN_ATTACKS[bb.WHITE]), _bit_table(bb.PAWN_ATTACKS[bb.BLACK])])
+RAYS = _ray_table()
+# Directions each piece type slides in, by type (pawns, knights and kings use none)
+SLIDES = np.zeros((6, 8), dtype=bool)
+SLIDES[bb.ROOK, :4] = SLIDES[bb.BISHOP, 4:] = SLIDES[bb.QUEEN] = True
+
+
+def from_positions(positions):
+	"""(boards, turns) arrays of a list of bitboard Positions."""
+	boards = np.array([position.mailbox for position in positions], dtype=np.int8).reshape(len(positions), 64)
+	turns = np.array([bb.WHITE if position.turn == 'w' else bb.BLACK for position in positions], dtype=np.int8)
+	return boards, turns
+
+
+def targets(boards, turns, squares):
+	"""(K, 64) bool array of the squares the piece on squares[k] of boards[k]
+	can move to (pseudo-legally), its side being turns[k]."""
+	count = len(boards)
+	games = np.arange(count)
+	pieces = boards[games, squares].astype(np.int64)
+	kinds = pieces % 6
+	occupied = boards >= 0
+	own = occupied & (boards // 6 == turns[:, None])
+	enemy = occupied & ~own
+	result = np.zeros((count, 64), dtype=bool)
+
+	jumps = KNIGHT_TARGETS[squares] & (kinds == bb.KNIGHT)[:, None]
+	jumps |= KING_TARGETS[squares] & (kinds == bb.KING)[:, None]
+	result |= jumps & ~own
+
+	# Sliders: a ray stops at the first occupied square, which it may capture if an enemy
+	rays = RAYS[squares]  # (K, 8, 7)
+	padded_occupied = np.pad(occupied, ((0, 0), (0, 1)), constant_values=True)
+	padded_own = np.pad(own, ((0, 0), (0, 1)), constant_values=True)
+	on_ray = padded_occupied[games[:, None, None], rays]
+	blocked = np.cumsum(on_ray, axis=2) - on_ray > 0
+	reach = ~blocked & ~padded_own[games[:, None, None], rays] & SLIDES[kinds][:, :, None]
+	slides = np.zeros((count, 65), dtype=bool)
+	slides[games[:, None, None], rays] = reach
+	# The padding square appears many times on a ray, so only the board squares count
+	result |= slides[:, :64]
+
+	pawns = kinds == bb.PAWN
+	if pawns.any():
+		step = np.where(turns == bb.WHITE, -8, 8)
+		ahead = np.clip(squares + step, 0, 63)
+		single = pawns & ~occupied[games, ahead]
+		start_row = np.where(turns == bb.WHITE, 6, 1)
+		two_ahead = np.clip(squares + 2 * step, 0, 63)
+		double = single & (squares // 8 == start_row) & ~occupied[games, two_ahead]
+		result[games[single], ahead[single]] = True
+		result[games[double], two_ahead[double]] = True
+		result |= PAWN_TARGETS[turns, squares] & enemy & pawns[:, None]
+	return result
+
+
+def random_moves(boards, turns, rng):
+	"""Pick a random pseudo-legal move for every board: (starts, ends, found),
+	found being False where MAX_PICKS random pieces had no move (or no piece
+	was left to try)."""
+	count = len(boards)
+	starts = np.zeros(count, dtype=np.int64)
+	ends = np.zeros(count, dtype=np.int64)
+	found = np.zeros(count, dtype=bool)
+	# Pieces still worth picking: ours, and not yet found to have no move
+	candidates = (boards >= 0) & (boards // 6 == turns[:, None])
+	pending = np.arange(count)
+	for _ in range(MAX_PICKS):
+		pending = pending[candidates[pending].any(axis=1)]
+		if not len(pending):
+			break
+		keys = np.where(candidates[pending], rng.random((len(pending), 64)), -1)
+		squares = keys.argmax(axis=1)
+		reachable = targets(boards[pending], turns[pending], squares)
+		keys = np.where(reachable, rng.random(reachable.shape), -1)
+		hit = reachable.any(axis=1)
+		starts[pending[hit]] = squares[hit]
+		ends[pending[hit]] = keys[hit].argmax(axis=1)
+		found[pending[hit]] = True
+		candidates[pending[~hit], squares[~hit]] = False
+		pending = pending[~hit]
+	return starts, ends, found
+
+
+def playout(boards, turns, max_plies=None, square_scores=None, rng=None):
+	"""Play random games from every board, at most max_plies moves each (None:
+	until all have ended), changing boards in place. Return (values, ended) for
+	the side that was to move at the start of each game: ended games have value
+	1 (won), -1 (lost) or 0 (stalemated); the others the evaluation of the board
+	they reached, the sum of square_scores[piece][square] signed for that side,
+	or 0 without square_scores."""
+	rng = rng if rng is not None else np.random.default_rng()
+	count = len(boards)
+	start_turns = turns.copy()
+	turns = turns.copy()
+	values = np.zeros(count)
+	ended = np.zeros(count, dtype=bool)
+	games = np.arange(count)
+	plies = 0
+	while (max_plies is None or plies < max_plies) and not ended.all():
+		active = games[~ended]
+		starts, ends, found = random_moves(boards[active], turns[active], rng)
+		stalemated = active[~found]
+		ended[stalemated] = True
+		active, starts, ends = active[found], starts[found], ends[found]
+		captured = boards[active, ends]
+		won = active[(captured >= 0) & (captured % 6 == bb.KING)]
+		pieces = boards[active, starts]
+		# Pawns only promote to queens in these rules
+		last_row = np.where(turns[active] == bb.WHITE, 0, 7)
+		promote = (pieces % 6 == bb.PAWN) & (ends // 8 == last_row)
+		pieces = np.where(promote, pieces + (bb.QUEEN - bb.PAWN), pieces)
+		boards[active, ends] = pieces
+		boards[active, starts] = bb.EMPTY
+		values[won] = np.where(turns[won] == start_turns[won], 1, -1)
+		ended[won] = True
+		turns[active] ^= 1
+		plies += 1
+	if square_scores is not None:
+		# Row 12 is for empty squares, which bb.EMPTY (-1) indexes
+		table = np.vstack([np.array(square_scores, dtype=np.float64), np.zeros(64)])
+		scores = table[boards.astype(np.int64), np.arange(64)].sum(axis=1)
+		going = ~ended
+		values[going] = np.where(start_turns[going] == bb.WHITE, scores[going], -scores[going])
+	return values, ended
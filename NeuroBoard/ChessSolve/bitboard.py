@@ -0,0 +1,608 @@
+"""
+Bitboard position and move generator.
+
+Squares are numbered row * 8 + col with row 0 at the top of the board (rank 8),
+the same (row, col) layout the list-of-strings board uses, so bit 0 is a8 and
+bit 63 is h1. Moves are returned in the same ((row, col), (row, col)) form as
+chess.generate_legal_moves, which makes Position a drop-in replacement for it.
+"""
+import random
+
+PIECES = 'PNBRQKpnbrqk'
+PIECE_INDEX = {piece: index for index, piece in enumerate(PIECES)}
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+WHITE, BLACK = 0, 1
+EMPTY = -1
+FULL = (1 << 64) - 1
+
+SQUARES = [(sq >> 3, sq & 7) for sq in range(64)]
+# Every (start, end) tuple is built once here so move generation never allocates one
+MOVES = [[(SQUARES[start], SQUARES[end]) for end in range(64)] for start in range(64)]
+
+ROW_MASKS = [0xFF << (8 * row) for row in range(8)]
+
+# Square scores used when a Position is built without an evaluation table
+NO_SCORES = [[0] * 64 for _ in range(12)]
+
+# Zobrist keys: one random 64-bit number per (piece, square) plus one for black
+# to move. A fixed seed keeps keys identical across processes and runs. These
+# rules have no castling or en passant, so those need no keys.
+_zobrist_random = random.Random(0x5A0B)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_BLACK = _zobrist_random.getrandbits(64)
+
+
+def _offset_attacks(offsets):
+	"""Attack table for a piece that jumps by fixed (row, col) offsets."""
+	table = []
+	for sq in range(64):
+		row, col = SQUARES[sq]
+		attacks = 0
+		for dr, dc in offsets:
+			r, c = row + dr, col + dc
+			if 0 <= r < 8 and 0 <= c < 8:
+				attacks |= 1 << (r * 8 + c)
+		table.append(attacks)
+	return table
+
+
+KNIGHT_ATTACKS = _offset_attacks([(-2, -1), (-1, -2), (1, -2), (2, -1), (2, 1), (1, 2), (-1, 2), (-2, 1)])
+KING_ATTACKS = _offset_attacks([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)])
+# White pawns move up the board (towards row 0), black pawns move down
+PAWN_ATTACKS = [_offset_attacks([(-1, -1), (-1, 1)]), _offset_attacks([(1, -1), (1, 1)])]
+
+ROOK_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (-1, -1), (1, -1), (-1, 1)]
+
+
+def _ray_attacks(sq, occupied, directions):
+	"""Slow reference slider attacks, only used to fill the lookup tables."""
+	row, col = SQUARES[sq]
+	attacks = 0
+	for dr, dc in directions:
+		r, c = row + dr, col + dc
+		while 0 <= r < 8 and 0 <= c < 8:
+			bit = 1 << (r * 8 + c)
+			attacks |= bit
+			if occupied & bit:
+				break
+			r, c = r + dr, c + dc
+	return attacks
+
+
+def _relevant_mask(sq, directions):
+	"""Squares whose occupancy can change the slider attacks (board edges excluded)."""
+	row, col = SQUARES[sq]
+	mask = 0
+	for dr, dc in directions:
+		r, c = row + dr, col + dc
+		while 0 <= r + dr < 8 and 0 <= c + dc < 8:
+			mask |= 1 << (r * 8 + c)
+			r, c = r + dr, c + dc
+	return mask
+
+
+def _slider_tables(directions):
+	"""
+	Magic-bitboard style lookup: for every square, map each subset of the relevant
+	occupancy mask to its attack set. A dict keyed by the masked occupancy plays the
+	role of the magic multiply-and-shift hash, which is the faster choice in Python.
+	"""
+	masks, tables = [], []
+	for sq in range(64):
+		mask = _relevant_mask(sq, directions)
+		table = {}
+		subset = 0
+		while True:
+			table[subset] = _ray_attacks(sq, subset, directions)
+			subset = (subset - mask) & mask  # Carry-Rippler walk over every subset
+			if not subset:
+				break
+		masks.append(mask)
+		tables.append(table)
+	return masks, tables
+
+
+ROOK_MASKS, ROOK_TABLES = _slider_tables(ROOK_DIRECTIONS)
+BISHOP_MASKS, BISHOP_TABLES = _slider_tables(BISHOP_DIRECTIONS)
+
+
+def _between_table():
+	"""BETWEEN[a][b]: squares strictly between a and b if they share a line, else 0."""
+	between = [[0] * 64 for _ in range(64)]
+	for start in range(64):
+		row, col = SQUARES[start]
+		for dr, dc in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+			r, c = row + dr, col + dc
+			squares = 0
+			while 0 <= r < 8 and 0 <= c < 8:
+				end = r * 8 + c
+				between[start][end] = squares
+				squares |= 1 << end
+				r, c = r + dr, c + dc
+	return between
+
+
+BETWEEN = _between_table()
+
+
+def rook_attacks(sq, occupied):
+	return ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+
+
+def bishop_attacks(sq, occupied):
+	return BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+
+
+def iter_bits(bb):
+	"""Yield the square index of every set bit."""
+	while bb:
+		lsb = bb & -bb
+		yield lsb.bit_length() - 1
+		bb ^= lsb
+
+
+class Position:
+	"""
+	Chess position held as 12 piece bitboards (PNBRQK for white, pnbrqk for black)
+	plus per-colour and total occupancy. A 64-entry mailbox mirrors the bitboards
+	so the piece on a square can be read without scanning them.
+
+	Position.key is the Zobrist hash of the position. It is computed once from
+	the board and then XOR-updated by every move and turn change.
+
+	square_scores[piece][sq] is the evaluation of having piece on sq (see
+	chess.square_scores_by_index). Position.score holds their sum over the board
+	and every move updates it by the difference, so reading it costs nothing.
+	"""
+
+	def __init__(self, board, turn='w', square_scores=None):
+		self.pieces = [0] * 12
+		self.mailbox = [EMPTY] * 64
+		for row in range(8):
+			for col in range(8):
+				piece = board[row][col]
+				if piece != '.':
+					index = PIECE_INDEX[piece]
+					sq = row * 8 + col
+					self.pieces[index] |= 1 << sq
+					self.mailbox[sq] = index
+		self.occupancy = [0, 0]
+		for index in range(12):
+			self.occupancy[index // 6] |= self.pieces[index]
+		self.occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+		self.turn = turn
+		self.square_scores = square_scores or NO_SCORES
+		self.score = sum(self.square_scores[index][sq] for sq, index in enumerate(self.mailbox) if index != EMPTY)
+		self.key = self.zobrist_key()
+
+	@classmethod
+	def from_fen(cls, fen, square_scores=None):
+		"""
+		Build a position from the first two fields of a FEN string. Castling and
+		en passant fields are ignored, since these rules have neither.
+		"""
+		fields = fen.split()
+		board = []
+		for rank in fields[0].split('/'):
+			row = []
+			for char in rank:
+				row.extend('.' * int(char) if char.isdigit() else char)
+			board.append(row)
+		turn = fields[1] if len(fields) > 1 else 'w'
+		return cls(board, turn, square_scores)
+
+	def fen(self):
+		"""FEN string of the position, with no castling rights or en passant square."""
+		ranks = []
+		for row in self.board:
+			rank = ''
+			empty = 0
+			for piece in row:
+				if piece == '.':
+					empty += 1
+					continue
+				if empty:
+					rank += str(empty)
+					empty = 0
+				rank += piece
+			ranks.append(rank + (str(empty) if empty else ''))
+		return '/'.join(ranks) + ' ' + self.turn + ' - - 0 1'
+
+	@property
+	def board(self):
+		"""The position as the 8x8 list-of-strings board used by the GUI and chess.py."""
+		board = [['.'] * 8 for _ in range(8)]
+		for sq, index in enumerate(self.mailbox):
+			if index != EMPTY:
+				board[sq >> 3][sq & 7] = PIECES[index]
+		return board
+
+	def copy(self):
+		new = object.__new__(type(self))
+		new.pieces = self.pieces[:]
+		new.mailbox = self.mailbox[:]
+		new.occupancy = self.occupancy[:]
+		new.occupied = self.occupied
+		new.turn = self.turn
+		new.square_scores = self.square_scores
+		new.score = self.score
+		new.key = self.key
+		return new
+
+	def zobrist_key(self):
+		"""Hash the position from scratch; Position.key holds the same value incrementally."""
+		key = ZOBRIST_BLACK if self.turn == 'b' else 0
+		for sq, index in enumerate(self.mailbox):
+			if index != EMPTY:
+				key ^= ZOBRIST_PIECES[index][sq]
+		return key
+
+	def updateTurn(self):
+		self.turn = 'b' if self.turn == 'w' else 'w'
+		self.key ^= ZOBRIST_BLACK
+
+	def update_board(self, start, end):
+		"""
+		Move the piece on start to end, promoting pawns that reach the last row to
+		queens, and return the undo information for unmake_move. The turn is not changed.
+		"""
+		sr, sc = start
+		er, ec = end
+		start = sr * 8 + sc
+		end = er * 8 + ec
+		pieces = self.pieces
+		mailbox = self.mailbox
+		occupancy = self.occupancy
+		scores = self.square_scores
+		piece = mailbox[start]
+		captured = mailbox[end]
+		color = piece // 6
+		start_bit = 1 << start
+		end_bit = 1 << end
+		undo = start, end, piece, captured, self.score, self.key
+		placed = piece + QUEEN if piece % 6 == PAWN and (er == 0 or er == 7) else piece
+		score = self.score + scores[placed][end] - scores[piece][start]
+		key = self.key ^ ZOBRIST_PIECES[piece][start] ^ ZOBRIST_PIECES[placed][end]
+		if captured != EMPTY:
+			pieces[captured] ^= end_bit
+			occupancy[color ^ 1] ^= end_bit
+			score -= scores[captured][end]
+			key ^= ZOBRIST_PIECES[captured][end]
+		pieces[piece] ^= start_bit
+		pieces[placed] |= end_bit
+		mailbox[start] = EMPTY
+		mailbox[end] = placed
+		occupancy[color] ^= start_bit | end_bit
+		self.occupied = occupancy[WHITE] | occupancy[BLACK]
+		self.score = score
+		self.key = key
+		return undo
+
+	def make_move(self, move):
+		"""Play move in place, switch the turn and return the undo information."""
+		undo = self.update_board(*move)
+		self.turn = 'b' if self.turn == 'w' else 'w'
+		self.key ^= ZOBRIST_BLACK
+		return undo
+
+	def unmake_move(self, undo):
+		"""Take back the move that returned undo from make_move."""
+		start, end, piece, captured, self.score, self.key = undo
+		pieces = self.pieces
+		mailbox = self.mailbox
+		occupancy = self.occupancy
+		color = piece // 6
+		start_bit = 1 << start
+		end_bit = 1 << end
+		pieces[mailbox[end]] ^= end_bit
+		pieces[piece] |= start_bit
+		mailbox[start] = piece
+		mailbox[end] = captured
+		occupancy[color] ^= start_bit | end_bit
+		if captured != EMPTY:
+			pieces[captured] |= end_bit
+			occupancy[color ^ 1] |= end_bit
+		self.occupied = occupancy[WHITE] | occupancy[BLACK]
+		self.turn = 'b' if self.turn == 'w' else 'w'
+
+	def is_attacked(self, sq, by, occupied=None, removed=0):
+		"""
+		Check whether side `by` attacks square sq. `occupied` and `removed` let the
+		caller ask the question for a board where a move has already been played:
+		`removed` masks out an attacker that the move captured.
+		"""
+		if occupied is None:
+			occupied = self.occupied
+		pieces = self.pieces
+		base = 6 * by
+		keep = ~removed
+		if PAWN_ATTACKS[by ^ 1][sq] & pieces[base + PAWN] & keep:
+			return True
+		if KNIGHT_ATTACKS[sq] & pieces[base + KNIGHT] & keep:
+			return True
+		if KING_ATTACKS[sq] & pieces[base + KING]:
+			return True
+		queens = pieces[base + QUEEN]
+		diagonal = (pieces[base + BISHOP] | queens) & keep
+		if diagonal and BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]] & diagonal:
+			return True
+		straight = (pieces[base + ROOK] | queens) & keep
+		if straight and ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]] & straight:
+			return True
+		return False
+
+	def king_square(self, color):
+		return self.pieces[6 * color + KING].bit_length() - 1
+
+	def in_check(self):
+		"""Check whether the side to move is in check."""
+		us = WHITE if self.turn == 'w' else BLACK
+		return self.is_attacked(self.king_square(us), us ^ 1)
+
+	def has_non_pawn_material(self):
+		"""Check whether the side to move has a piece other than pawns and the king."""
+		base = 0 if self.turn == 'w' else 6
+		pieces = self.pieces
+		return bool(pieces[base + KNIGHT] | pieces[base + BISHOP] | pieces[base + ROOK] | pieces[base + QUEEN])
+
+	def pseudo_legal_moves(self):
+		"""Yield (start, end) square indices for every move that ignores checks."""
+		us = WHITE if self.turn == 'w' else BLACK
+		pieces = self.pieces
+		base = 6 * us
+		own = self.occupancy[us]
+		enemy = self.occupancy[us ^ 1]
+		empty = ~self.occupied & FULL
+		occupied = self.occupied
+
+		pawns = pieces[base + PAWN]
+		if us == WHITE:
+			single = (pawns >> 8) & empty
+			double = ((single & ROW_MASKS[5]) >> 8) & empty
+			step = 8
+		else:
+			single = (pawns << 8) & empty
+			double = ((single & ROW_MASKS[2]) << 8) & empty
+			step = -8
+		for end in iter_bits(single):
+			yield end + step, end
+		for end in iter_bits(double):
+			yield end + 2 * step, end
+		pawn_attacks = PAWN_ATTACKS[us]
+		for start in iter_bits(pawns):
+			for end in iter_bits(pawn_attacks[start] & enemy):
+				yield start, end
+
+		for start in iter_bits(pieces[base + KNIGHT]):
+			for end in iter_bits(KNIGHT_ATTACKS[start] & ~own):
+				yield start, end
+		for start in iter_bits(pieces[base + BISHOP] | pieces[base + QUEEN]):
+			for end in iter_bits(BISHOP_TABLES[start][occupied & BISHOP_MASKS[start]] & ~own):
+				yield start, end
+		for start in iter_bits(pieces[base + ROOK] | pieces[base + QUEEN]):
+			for end in iter_bits(ROOK_TABLES[start][occupied & ROOK_MASKS[start]] & ~own):
+				yield start, end
+		for start in iter_bits(pieces[base + KING]):
+			for end in iter_bits(KING_ATTACKS[start] & ~own):
+				yield start, end
+
+	def is_legal(self, start, end):
+		"""Check that the pseudo-legal move start -> end does not leave our king attacked."""
+		us = self.mailbox[start] // 6
+		start_bit = 1 << start
+		end_bit = 1 << end
+		occupied = (self.occupied ^ start_bit) | end_bit
+		king = end if self.mailbox[start] % 6 == KING else self.king_square(us)
+		if king < 0:
+			raise ValueError("King not found on the board!")
+		return not self.is_attacked(king, us ^ 1, occupied, end_bit)
+
+	def is_legal_move(self, start, end):
+		"""
+		Check that start -> end is a legal move for the side to move. Unlike
+		is_legal, the move may come from anywhere, such as a move stored for
+		another position.
+		"""
+		piece = self.mailbox[start]
+		us = WHITE if self.turn == 'w' else BLACK
+		if piece == EMPTY or piece // 6 != us or self.occupancy[us] >> end & 1:
+			return False
+		kind = piece % 6
+		if kind == PAWN:
+			step = -8 if us == WHITE else 8
+			if self.mailbox[end] != EMPTY:
+				reachable = PAWN_ATTACKS[us][start] >> end & 1
+			elif end == start + step:
+				reachable = True
+			else:
+				start_row = ROW_MASKS[6] if us == WHITE else ROW_MASKS[1]
+				reachable = end == start + 2 * step and start_row >> start & 1 and self.mailbox[start + step] == EMPTY
+		elif kind == KNIGHT:
+			reachable = KNIGHT_ATTACKS[start] >> end & 1
+		elif kind == BISHOP:
+			reachable = bishop_attacks(start, self.occupied) >> end & 1
+		elif kind == ROOK:
+			reachable = rook_attacks(start, self.occupied) >> end & 1
+		elif kind == QUEEN:
+			reachable = (bishop_attacks(start, self.occupied) | rook_attacks(start, self.occupied)) >> end & 1
+		else:
+			reachable = KING_ATTACKS[start] >> end & 1
+		return bool(reachable) and self.is_legal(start, end)
+
+	def random_move(self, rng=random, tries=8):
+		"""
+		Return a random legal move, or None if there is none, for fast playouts.
+		A random piece of the side to move is picked, then a random square it
+		attacks or can push to, and the move is kept if is_legal accepts it; that
+		skips generating every legal move. After tries misses it falls back to
+		generate_legal_moves. Moves are not equally likely: a piece with few moves
+		gets each of them more often.
+		"""
+		us = WHITE if self.turn == 'w' else BLACK
+		own = self.occupancy[us]
+		mailbox = self.mailbox
+		occupied = self.occupied
+		starts = list(iter_bits(own))
+		for _ in range(tries):
+			start = rng.choice(starts)
+			kind = mailbox[start] % 6
+			if kind == PAWN:
+				step = -8 if us == WHITE else 8
+				ends = PAWN_ATTACKS[us][start] & self.occupancy[us ^ 1]
+				if not occupied >> (start + step) & 1:
+					ends |= 1 << (start + step)
+					start_row = ROW_MASKS[6] if us == WHITE else ROW_MASKS[1]
+					if start_row >> start & 1 and not occupied >> (start + 2 * step) & 1:
+						ends |= 1 << (start + 2 * step)
+			elif kind == KNIGHT:
+				ends = KNIGHT_ATTACKS[start] & ~own
+			elif kind == BISHOP:
+				ends = BISHOP_TABLES[start][occupied & BISHOP_MASKS[start]] & ~own
+			elif kind == ROOK:
+				ends = ROOK_TABLES[start][occupied & ROOK_MASKS[start]] & ~own
+			elif kind == QUEEN:
+				ends = (BISHOP_TABLES[start][occupied & BISHOP_MASKS[start]] |
+					ROOK_TABLES[start][occupied & ROOK_MASKS[start]]) & ~own
+			else:
+				ends = KING_ATTACKS[start] & ~own
+			if not ends:
+				continue
+			end = rng.choice(list(iter_bits(ends)))
+			if self.is_legal(start, end):
+				return MOVES[start][end]
+		moves = self.generate_legal_moves()
+		return rng.choice(moves) if moves else None
+
+	def checkers_and_pins(self, us):
+		"""
+		Return (king square, checkers bitboard, pins) for side us. pins maps the
+		square of every pinned piece to the line it may still move along: the
+		squares between the king and the pinning slider, plus the slider itself.
+		"""
+		pieces = self.pieces
+		base = 6 * (us ^ 1)
+		king = self.king_square(us)
+		if king < 0:
+			raise ValueError("King not found on the board!")
+		checkers = (PAWN_ATTACKS[us][king] & pieces[base + PAWN]) | (KNIGHT_ATTACKS[king] & pieces[base + KNIGHT])
+		queens = pieces[base + QUEEN]
+		# Sliders that would hit the king on an empty board either check it, pin
+		# exactly one of our pieces to it, or are blocked by two or more pieces
+		snipers = (ROOK_TABLES[king][0] & (pieces[base + ROOK] | queens)) | (BISHOP_TABLES[king][0] & (pieces[base + BISHOP] | queens))
+		own = self.occupancy[us]
+		occupied = self.occupied
+		between = BETWEEN[king]
+		pins = {}
+		for sniper in iter_bits(snipers):
+			blockers = between[sniper] & occupied
+			if not blockers:
+				checkers |= 1 << sniper
+			elif not blockers & (blockers - 1) and blockers & own:
+				pins[blockers.bit_length() - 1] = between[sniper] | (1 << sniper)
+		return king, checkers, pins
+
+	def generate_legal_moves(self, captures_only=False, quiets_only=False):
+		"""
+		Generate all legal moves for the side to move, in the ((row, col), (row, col))
+		form used by chess.generate_legal_moves.
+
+		With captures_only, only captures and pawn promotions are generated, which
+		is what quiescence search expands; quiets_only generates the other moves.
+
+		Checkers and pinned pieces are computed once, so only king moves need an
+		attack lookup: in double check only the king moves, in single check the
+		other pieces must capture the checker or block, and pinned pieces stay on
+		their pin line. This rule set has no en passant, so there is no
+		discovered check through a captured pawn to handle.
+		"""
+		us = WHITE if self.turn == 'w' else BLACK
+		them = us ^ 1
+		pieces = self.pieces
+		base = 6 * us
+		own = self.occupancy[us]
+		enemy = self.occupancy[them]
+		occupied = self.occupied
+		empty = ~occupied & FULL
+		wanted = enemy if captures_only else empty if quiets_only else ~own
+		king, checkers, pins = self.checkers_and_pins(us)
+		moves = []
+		append = moves.append
+
+		# The king is taken off the board so it cannot hide behind itself on a checking line
+		without_king = occupied ^ (1 << king)
+		for end in iter_bits(KING_ATTACKS[king] & wanted):
+			if not self.is_attacked(end, them, without_king, 1 << end):
+				append(MOVES[king][end])
+		if checkers & (checkers - 1):
+			return moves
+
+		if checkers:
+			target = checkers | BETWEEN[king][checkers.bit_length() - 1]
+		else:
+			target = FULL
+		targets = target & wanted
+		pinned = 0
+		for sq in pins:
+			pinned |= 1 << sq
+
+		pawns = pieces[base + PAWN]
+		free_pawns = pawns & ~pinned
+		if us == WHITE:
+			single = (free_pawns >> 8) & empty
+			double = ((single & ROW_MASKS[5]) >> 8) & empty
+			step = 8
+			start_row = ROW_MASKS[6]
+			last_row = ROW_MASKS[0]
+		else:
+			single = (free_pawns << 8) & empty
+			double = ((single & ROW_MASKS[2]) << 8) & empty
+			step = -8
+			start_row = ROW_MASKS[1]
+			last_row = ROW_MASKS[7]
+		push_target = target
+		if captures_only:
+			# Only pushes that promote
+			push_target &= last_row
+		elif quiets_only:
+			push_target &= ~last_row
+		for end in iter_bits(single & push_target):
+			append(MOVES[end + step][end])
+		for end in iter_bits(double & push_target):
+			append(MOVES[end + 2 * step][end])
+		for start in iter_bits(pawns & pinned):
+			allowed = push_target & pins[start]
+			end = start - step
+			if empty >> end & 1:
+				if allowed >> end & 1:
+					append(MOVES[start][end])
+				end -= step
+				if start_row >> start & 1 and empty >> end & 1 and allowed >> end & 1:
+					append(MOVES[start][end])
+		if not quiets_only:
+			pawn_attacks = PAWN_ATTACKS[us]
+			for start in iter_bits(pawns):
+				captures = pawn_attacks[start] & enemy & target
+				if captures and pinned >> start & 1:
+					captures &= pins[start]
+				for end in iter_bits(captures):
+					append(MOVES[start][end])
+
+		# A pinned knight can never stay on its pin line
+		for start in iter_bits(pieces[base + KNIGHT] & ~pinned):
+			for end in iter_bits(KNIGHT_ATTACKS[start] & targets):
+				append(MOVES[start][end])
+		queens = pieces[base + QUEEN]
+		for start in iter_bits(pieces[base + BISHOP] | queens):
+			ends = BISHOP_TABLES[start][occupied & BISHOP_MASKS[start]] & targets
+			if pinned >> start & 1:
+				ends &= pins[start]
+			for end in iter_bits(ends):
+				append(MOVES[start][end])
+		for start in iter_bits(pieces[base + ROOK] | queens):
+			ends = ROOK_TABLES[start][occupied & ROOK_MASKS[start]] & targets
+			if pinned >> start & 1:
+				ends &= pins[start]
+			for end in iter_bits(ends):
+				append(MOVES[start][end])
+		return moves
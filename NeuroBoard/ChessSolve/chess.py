@@ -1,3 +1,9 @@
+import numpy as np
+
+import batch_playout
+import bitboard as bb
+from games4e import Game, Rollout
+
 def generate_legal_moves(engine, check_incheck=True):
 	"""
 	Generate all legal moves for the current player's turn.
@@ -159,31 +165,62 @@ def is_king_in_check(engine):
 	king_position = None
 
 	for row in range(8):
-		for col in range(8):
-			if engine.board[row][col] == king_symbol:
-				king_position = (row, col)
-				break
-		if king_position:
+		if king_symbol in engine.board[row]:
+			king_position = (row, engine.board[row].index(king_symbol))
 			break
 
 	if not king_position:
 		raise ValueError("King not found on the board!")
 
 	# Check if any enemy piece attacks the king
-	engine.updateTurn()
-	moves = generate_legal_moves(engine, check_incheck=False)
-	engine.updateTurn()
-	if king_position in [end for _, end in moves]:
-		return True
-		
-	# 
-	# opponent_turn = 'b' if engine.turn == 'w' else 'w'
-	# for row in range(8):
-	# 	for col in range(8):
-	# 		piece = engine.board[row][col]
-	# 		if piece != '.' and ((opponent_turn == 'w' and piece.isupper()) or (opponent_turn == 'b' and piece.islower())):
-	# 			if king_position in [end for start, end in get_piece_moves(engine, piece, (row, col))]:
-	# 				return True
+	opponent_turn = 'b' if engine.turn == 'w' else 'w'
+	return square_attacked_by(engine.board, king_position, opponent_turn)
+
+knight_offsets = [(-2, -1), (-1, -2), (1, -2), (2, -1), (2, 1), (1, 2), (-1, 2), (-2, 1)]
+king_offsets = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+rook_directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+bishop_directions = [(1, 1), (-1, -1), (1, -1), (-1, 1)]
+
+def square_attacked_by(board, square, side):
+	"""
+	Check if any piece of side ('w' or 'b') attacks square.
+	Instead of generating the opponent's moves, look outward from the square:
+	pawn, knight and king patterns first, then rook and bishop rays.
+	"""
+	row, col = square
+	if side == 'w':
+		pawn, knight, bishop, rook, queen, king = 'P', 'N', 'B', 'R', 'Q', 'K'
+		pawn_row = row + 1  # White pawns capture upwards, so they stand one row below
+	else:
+		pawn, knight, bishop, rook, queen, king = 'p', 'n', 'b', 'r', 'q', 'k'
+		pawn_row = row - 1
+
+	if 0 <= pawn_row < 8:
+		if col > 0 and board[pawn_row][col - 1] == pawn:
+			return True
+		if col < 7 and board[pawn_row][col + 1] == pawn:
+			return True
+
+	for dx, dy in knight_offsets:
+		r, c = row + dx, col + dy
+		if 0 <= r < 8 and 0 <= c < 8 and board[r][c] == knight:
+			return True
+
+	for dx, dy in king_offsets:
+		r, c = row + dx, col + dy
+		if 0 <= r < 8 and 0 <= c < 8 and board[r][c] == king:
+			return True
+
+	for directions, slider in ((rook_directions, rook), (bishop_directions, bishop)):
+		for dx, dy in directions:
+			r, c = row + dx, col + dy
+			while 0 <= r < 8 and 0 <= c < 8:
+				piece = board[r][c]
+				if piece != '.':
+					if piece == slider or piece == queen:
+						return True
+					break
+				r, c = r + dx, c + dy
 
 	return False
 
@@ -207,111 +244,299 @@ def is_enemy_piece(engine, row, col):
 	piece = engine.board[row][col]
 	return piece != '.' and ((engine.turn == 'b' and piece.isupper()) or (engine.turn == 'w' and piece.islower()))
 
-def evaluate_board(board):
-    piece_values = {
-        "p": 100, "n": 300, "b": 330, "r": 500, "q": 900, "k": 0,
-        "P": 100, "N": 300, "B": 330, "R": 500, "Q": 900, "K": 0
-    }
-    
-    # Positional values for all pieces
-    pawn_table = [
-        [0, 0, 0, 0, 0, 0, 0, 0],
-        [5, 10, 10, -20, -20, 10, 10, 5],
-        [5, -5, -10, 0, 0, -10, -5, 5],
-        [0, 0, 0, 20, 20, 0, 0, 0],
-        [5, 5, 10, 25, 25, 10, 5, 5],
-        [10, 10, 20, 30, 30, 20, 10, 10],
-        [50, 50, 50, 50, 50, 50, 50, 50],
-        [0, 0, 0, 0, 0, 0, 0, 0],
-    ]
-    knight_table = [
-        [-50, -40, -30, -30, -30, -30, -40, -50],
-        [-40, -20, 0, 0, 0, 0, -20, -40],
-        [-30, 0, 10, 15, 15, 10, 0, -30],
-        [-30, 5, 15, 20, 20, 15, 5, -30],
-        [-30, 0, 15, 20, 20, 15, 0, -30],
-        [-30, 5, 10, 15, 15, 10, 5, -30],
-        [-40, -20, 0, 5, 5, 0, -20, -40],
-        [-50, -40, -30, -30, -30, -30, -40, -50],
-    ]
-    bishop_table = [
-        [-20, -10, -10, -10, -10, -10, -10, -20],
-        [-10, 0, 0, 0, 0, 0, 0, -10],
-        [-10, 0, 5, 10, 10, 5, 0, -10],
-        [-10, 5, 5, 10, 10, 5, 5, -10],
-        [-10, 0, 10, 10, 10, 10, 0, -10],
-        [-10, 10, 10, 10, 10, 10, 10, -10],
-        [-10, 5, 0, 0, 0, 0, 5, -10],
-        [-20, -10, -10, -10, -10, -10, -10, -20],
-    ]
-    rook_table = [
-        [0, 0, 0, 0, 0, 0, 0, 0],
-        [5, 10, 10, 10, 10, 10, 10, 5],
-        [-5, 0, 0, 0, 0, 0, 0, -5],
-        [-5, 0, 0, 0, 0, 0, 0, -5],
-        [-5, 0, 0, 0, 0, 0, 0, -5],
-        [-5, 0, 0, 0, 0, 0, 0, -5],
-        [-5, 0, 0, 0, 0, 0, 0, -5],
-        [0, 0, 0, 5, 5, 0, 0, 0],
-    ]
-    queen_table = [
-        [-20, -10, -10, -5, -5, -10, -10, -20],
-        [-10, 0, 0, 0, 0, 0, 0, -10],
-        [-10, 0, 5, 5, 5, 5, 0, -10],
-        [-5, 0, 5, 5, 5, 5, 0, -5],
-        [0, 0, 5, 5, 5, 5, 0, -5],
-        [-10, 5, 5, 5, 5, 5, 0, -10],
-        [-10, 0, 5, 0, 0, 0, 0, -10],
-        [-20, -10, -10, -5, -5, -10, -10, -20],
-    ]
-    king_table = [
-        [-30, -40, -40, -50, -50, -40, -40, -30],
-        [-30, -40, -40, -50, -50, -40, -40, -30],
-        [-30, -40, -40, -50, -50, -40, -40, -30],
-        [-30, -40, -40, -50, -50, -40, -40, -30],
-        [-20, -30, -30, -40, -40, -30, -30, -20],
-        [-10, -20, -20, -20, -20, -20, -20, -10],
-        [20, 20, 0, 0, 0, 0, 20, 20],
-        [20, 30, 10, 0, 0, 10, 30, 20],
-    ]
+piece_values = {
+    "p": 100, "n": 300, "b": 330, "r": 500, "q": 900, "k": 0,
+    "P": 100, "N": 300, "B": 330, "R": 500, "Q": 900, "K": 0
+}
+
+# Positional values for all pieces
+pawn_table = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [5, 10, 10, -20, -20, 10, 10, 5],
+    [5, -5, -10, 0, 0, -10, -5, 5],
+    [0, 0, 0, 20, 20, 0, 0, 0],
+    [5, 5, 10, 25, 25, 10, 5, 5],
+    [10, 10, 20, 30, 30, 20, 10, 10],
+    [50, 50, 50, 50, 50, 50, 50, 50],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+]
+knight_table = [
+    [-50, -40, -30, -30, -30, -30, -40, -50],
+    [-40, -20, 0, 0, 0, 0, -20, -40],
+    [-30, 0, 10, 15, 15, 10, 0, -30],
+    [-30, 5, 15, 20, 20, 15, 5, -30],
+    [-30, 0, 15, 20, 20, 15, 0, -30],
+    [-30, 5, 10, 15, 15, 10, 5, -30],
+    [-40, -20, 0, 5, 5, 0, -20, -40],
+    [-50, -40, -30, -30, -30, -30, -40, -50],
+]
+bishop_table = [
+    [-20, -10, -10, -10, -10, -10, -10, -20],
+    [-10, 0, 0, 0, 0, 0, 0, -10],
+    [-10, 0, 5, 10, 10, 5, 0, -10],
+    [-10, 5, 5, 10, 10, 5, 5, -10],
+    [-10, 0, 10, 10, 10, 10, 0, -10],
+    [-10, 10, 10, 10, 10, 10, 10, -10],
+    [-10, 5, 0, 0, 0, 0, 5, -10],
+    [-20, -10, -10, -10, -10, -10, -10, -20],
+]
+rook_table = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [5, 10, 10, 10, 10, 10, 10, 5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [0, 0, 0, 5, 5, 0, 0, 0],
+]
+queen_table = [
+    [-20, -10, -10, -5, -5, -10, -10, -20],
+    [-10, 0, 0, 0, 0, 0, 0, -10],
+    [-10, 0, 5, 5, 5, 5, 0, -10],
+    [-5, 0, 5, 5, 5, 5, 0, -5],
+    [0, 0, 5, 5, 5, 5, 0, -5],
+    [-10, 5, 5, 5, 5, 5, 0, -10],
+    [-10, 0, 5, 0, 0, 0, 0, -10],
+    [-20, -10, -10, -5, -5, -10, -10, -20],
+]
+king_table = [
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-20, -30, -30, -40, -40, -30, -30, -20],
+    [-10, -20, -20, -20, -20, -20, -20, -10],
+    [20, 20, 0, 0, 0, 0, 20, 20],
+    [20, 30, 10, 0, 0, 10, 30, 20],
+]
+piece_tables = {
+    "p": pawn_table, "n": knight_table, "b": bishop_table,
+    "r": rook_table, "q": queen_table, "k": king_table,
+}
+
+def build_square_scores():
+    """
+    Flatten material plus piece-square value into one table per piece, indexed by
+    square (row * 8 + col) and signed so white is positive, black negative.
+    Black reads the tables upside down.
+    """
+    scores = {}
+    for piece, value in piece_values.items():
+        table = piece_tables[piece.lower()]
+        if piece.isupper():
+            scores[piece] = [value + table[sq >> 3][sq & 7] for sq in range(64)]
+        else:
+            scores[piece] = [-(value + table[7 - (sq >> 3)][sq & 7]) for sq in range(64)]
+    return scores
+
+square_scores = build_square_scores()
+# Same table indexed by bitboard piece index, for Position's running score
+square_scores_by_index = [square_scores[piece] for piece in bb.PIECES]
 
+def evaluate_board(board):
+    """
+    Material plus piece-square score of a list board, positive when white is better.
+    Positions keep this score up to date on every move in Position.score.
+    """
     evaluation = 0
     for row in range(8):
         for col in range(8):
             piece = board[row][col]
-            if piece == '.':
-                continue
-
-            value = piece_values[piece]
-            if piece.isupper():  # White piece
-                evaluation += value
-                if piece == "P":
-                    evaluation += pawn_table[row][col]
-                elif piece == "N":
-                    evaluation += knight_table[row][col]
-                elif piece == "B":
-                    evaluation += bishop_table[row][col]
-                elif piece == "R":
-                    evaluation += rook_table[row][col]
-                elif piece == "Q":
-                    evaluation += queen_table[row][col]
-                elif piece == "K":
-                    evaluation += king_table[row][col]
-            else:  # Black piece
-                evaluation -= value
-                if piece == "p":
-                    evaluation -= pawn_table[7 - row][col]
-                elif piece == "n":
-                    evaluation -= knight_table[7 - row][col]
-                elif piece == "b":
-                    evaluation -= bishop_table[7 - row][col]
-                elif piece == "r":
-                    evaluation -= rook_table[7 - row][col]
-                elif piece == "q":
-                    evaluation -= queen_table[7 - row][col]
-                elif piece == "k":
-                    evaluation -= king_table[7 - row][col]
+            if piece != '.':
+                evaluation += square_scores[piece][row * 8 + col]
 
     return evaluation
 
 
+# mvv_lva[attacker][victim] by bitboard piece type: the most valuable victim
+# first, then the least valuable attacker. Always positive.
+mvv_lva = [[(victim + 1) * 10 - attacker for victim in range(6)] for attacker in range(6)]
+
+# Material value by bitboard piece index, and what a pawn gains by promoting
+material_by_index = [piece_values[piece] for piece in bb.PIECES]
+promotion_gain = piece_values['Q'] - piece_values['P']
+
+
+class Statecopy(bb.Position):
+	"""
+	Search state for ChessGame, copied from the GUI or web engine board
+	(anything with .board and .turn) into a bitboard Position.
+	"""
+	def __init__(self, realstate):
+		bb.Position.__init__(self, realstate.board, realstate.turn, square_scores_by_index)
+
+
+class ChessGame(Game):
+
+	# Without the fifty-move and repetition rules a random game may never end
+	default_rollout = Rollout(max_plies=40)
+
+	def actions(self, state):
+		"""
+		Return all legal moves in the current state.
+		"""
+		return state.generate_legal_moves()
+
+	def result(self, state, move):
+		"""
+		Return the new state after applying the move.
+		"""
+		new_state = state.copy()
+		new_state.make_move(move)
+		return new_state
+
+	def make_move(self, state, move):
+		"""
+		Apply the move to state in place and return what unmake_move needs to take it back.
+		"""
+		return state.make_move(move)
+
+	def unmake_move(self, state, undo):
+		"""
+		Take back a move made with make_move.
+		"""
+		state.unmake_move(undo)
+
+	def make_null_move(self, state):
+		"""
+		Pass the turn without moving, for null-move pruning. Passing the turn
+		back undoes it, so there is no undo information: this returns None.
+		"""
+		state.updateTurn()
+
+	def unmake_null_move(self, state, undo):
+		"""
+		Take back a null move.
+		"""
+		state.updateTurn()
+
+	def has_non_pawn_material(self, state):
+		"""
+		Check whether the player to move has pieces besides pawns and the king.
+		Without them zugzwang is common, so null-move pruning is not safe.
+		"""
+		return state.has_non_pawn_material()
+
+	def capture_score(self, state, move):
+		"""
+		MVV-LVA score of a capture for move ordering, 0 for a quiet move.
+		"""
+		(sx, sy), (ex, ey) = move
+		victim = state.mailbox[ex * 8 + ey]
+		if victim == bb.EMPTY:
+			return 0
+		return mvv_lva[state.mailbox[sx * 8 + sy] % 6][victim % 6]
+
+	def captures(self, state):
+		"""
+		Return the legal captures and promotions, the moves quiescence search expands.
+		"""
+		return state.generate_legal_moves(captures_only=True)
+
+	def quiet_moves(self, state):
+		"""
+		Return the legal moves that are neither captures nor promotions.
+		"""
+		return state.generate_legal_moves(quiets_only=True)
+
+	def random_move(self, state):
+		"""
+		Return a random legal move, or None when the game is over, without
+		generating all of them; for Monte Carlo playouts.
+		"""
+		return state.random_move()
+
+	def playouts(self, states, max_plies=None):
+		"""
+		Random playouts from all the states at once on NumPy arrays (see
+		batch_playout), for Monte Carlo tree search with Rollout.batch. States
+		already checkmated (-1) or stalemated (0) are scored without playing:
+		the playouts only end a game when a king is taken.
+		"""
+		boards, turns = batch_playout.from_positions(states)
+		values = np.zeros(len(states))
+		ended = np.zeros(len(states), dtype=bool)
+		for i, state in enumerate(states):
+			if state.random_move() is None:
+				ended[i] = True
+				values[i] = -1 if state.in_check() else 0
+		going = ~ended
+		values[going], ended[going] = batch_playout.playout(boards[going], turns[going], max_plies, square_scores_by_index)
+		return values, ended
+
+	def is_legal(self, state, move):
+		"""
+		Check that move, which may come from another position, is legal in state.
+		"""
+		(sx, sy), (ex, ey) = move
+		return state.is_legal_move(sx * 8 + sy, ex * 8 + ey)
+
+	def capture_value(self, state, move):
+		"""
+		Material the move wins: the captured piece plus any promotion gain.
+		Used for delta pruning in quiescence search.
+		"""
+		(sx, sy), (ex, ey) = move
+		victim = state.mailbox[ex * 8 + ey]
+		value = 0 if victim == bb.EMPTY else material_by_index[victim]
+		if ex in (0, 7) and state.mailbox[sx * 8 + sy] % 6 == bb.PAWN:
+			value += promotion_gain
+		return value
+
+	def in_check(self, state):
+		"""
+		Check whether the player to move is in check.
+		"""
+		return state.in_check()
+
+	def serialize(self, state):
+		"""
+		FEN string of the state, for sending it to another process.
+		"""
+		return state.fen()
+
+	def deserialize(self, text):
+		"""
+		Rebuild a state from serialize's FEN string.
+		"""
+		return bb.Position.from_fen(text, square_scores_by_index)
+
+	def encode_move(self, move):
+		"""
+		Pack a move into an integer, for the shared transposition table.
+		"""
+		(sx, sy), (ex, ey) = move
+		return (sx * 8 + sy) << 6 | (ex * 8 + ey)
+
+	def decode_move(self, code):
+		"""
+		Unpack a move packed by encode_move.
+		"""
+		return bb.MOVES[code >> 6][code & 63]
+
+	def hash_key(self, state):
+		"""
+		Zobrist key of the position, for the transposition table.
+		"""
+		return state.key
+
+	def utility(self, state, player):
+		"""
+		Define a utility function: positive for white, negative for black.
+		"""
+		# Material and piece-square score, kept up to date by every move
+		score = state.score
+		return score if player=='w' else -score
+
+	def terminal_test(self, state):
+		"""
+		Check if the game is over.
+		"""
+		return not self.actions(state)
+
+	def to_move(self, state):
+		"""
+		Return the player whose turn it is to move.
+		"""
+		return state.turn
@@ -1,69 +1,16 @@
+import queue
+import threading
 import tkinter as tk
 import tkinter.ttk as ttk
 
 from PIL import Image, ImageTk
 import chess as cl
-from games4e import Game, alpha_beta_cutoff_search
-import copy
-
-class Statecopy:
-	def __init__(self, realstate):
-		self.board = copy.deepcopy(realstate.board)
-		self.turn = realstate.turn
-
-	def updateTurn(self):
-		self.turn = 'b' if self.turn == 'w' else 'w'
-
-	def update_board(self, start, end):
-		sx, sy = start
-		ex, ey = end
-		self.board[ex][ey] = self.board[sx][sy]
-		self.board[sx][sy] = '.'
-		#check promotion
-		if self.board[ex][ey].lower()=='p' and (ex==7 or ex==0):
-			print('promote')
-			self.board[ex][ey] = "Q" if self.board[ex][ey].isupper() else "q"
-
-
-class ChessGame(Game):
-
-	def actions(self, state):
-		"""
-		Return all legal moves in the current state.
-		"""
-		return list(cl.generate_legal_moves(state))
-
-	def result(self, state, move):
-		"""
-		Return the new state after applying the move.
-		"""
-		start, end = move
-		
-		new_state = Statecopy(state)
-		new_state.update_board(start, end)
-		new_state.updateTurn()
-		return new_state
-
-	def utility(self, state, player):
-		"""
-		Define a utility function: positive for white, negative for black.
-		"""
-		# Use a simple evaluation based on material
-		score = cl.evaluate_board(state.board)
-		return score if player=='w' else -score
-
-	def terminal_test(self, state):
-		"""
-		Check if the game is over.
-		"""
-		return not self.actions(state)
-
-	def to_move(self, state):
-		"""
-		Return the player whose turn it is to move.
-		"""
-		return state.turn
+from games4e import iterative_deepening_search, Ponder, Pruning, Quiescence, SearchStats, TranspositionTable
 
+# Seconds the bot may think per move
+BOT_TIME_LIMIT = 2.0
+# Milliseconds between checks for the bot's progress while it thinks
+BOT_POLL_INTERVAL = 50
 
 
 class MainApp:
@@ -74,6 +21,14 @@ class MainApp:
 		self.start_square = None
 		self.moves_highlight = None
 		self.square_size = 80
+		self.tt = TranspositionTable(megabytes=64)  # Kept between bot moves, replaced when a search is abandoned
+		self.time_limit = BOT_TIME_LIMIT
+		# The running bot search: the event that cancels it and the queue it reports to
+		self.bot_stop = None
+		self.bot_queue = None
+		# Search of the human's expected reply while they think, and the queue it reports to
+		self.ponder = None
+		self.ponder_queue = None
 		self.pieces_dict = {'P':'white_pawn', 'R':'white_rook', 'N':'white_knight', 'B':'white_bishop', 'Q':'white_queen', 'K':'white_king', 'p':'black_pawn', 'r':'black_rook', 'n':'black_knight', 'b':'black_bishop', 'q':'black_queen', 'k':'black_king'}
 
 		self.width = 670
@@ -117,11 +72,14 @@ class MainApp:
 		self.canvas.bind("<ButtonRelease-1>", self.on_piece_drop)
 
 	def reset(self):
+		self.cancel_bot()
 		self.board = self.initialize_board()
 		self.turn = 'w'  # 'w' for white, 'b' for black
 		self.selected_piece = None
 		self.start_square = None
 		self.moves_highlight = None
+		# A new game, and the cancelled bot search may still be writing to the old table
+		self.tt = TranspositionTable(megabytes=64)
 		self.piece_images_DRAG = None
 		self.piece_images = self.load_piece_images()
 		self.draw_board()
@@ -202,6 +160,8 @@ class MainApp:
 		row = event.y // self.square_size
 		if (col > 7 or col < 0 or row > 7 or row < 0):
 			return
+		if self.bot_queue is not None:
+			return  # The bot is thinking
 		piece = self.board[row][col]
 
 		if piece != '.' and ((self.turn == 'w' and piece.isupper()) or (self.turn == 'b' and piece.islower())):
@@ -266,6 +226,7 @@ class MainApp:
 		col = event.x // self.square_size
 		row = event.y // self.square_size
 		end_square = (row, col)
+		move = (self.start_square, end_square)
 		if self.is_valid_move(self.start_square, end_square):
 			self.update_board(self.start_square, end_square)
 			self.updateTurn()
@@ -275,7 +236,7 @@ class MainApp:
 
 		#bot search for best move
 		if self.turn == 'b':
-			self.window.after(100, self.play_bot)
+			self.window.after(100, self.play_bot, move)
 			#self.play_bot()
 
 	def reload(self):
@@ -286,23 +247,88 @@ class MainApp:
 		self.moves_highlight = None
 		self.canvas.delete("moves_highlight")
 
-	def play_bot(self):
-		chessbotgame = ChessGame()
-		new_state = Statecopy(self)
-		move = None
+	def play_bot(self, reply=None):
+		"""Start the bot's search on a worker thread, so the window stays responsive; poll_bot picks up its progress and move.
+		reply is the move the human just played: if the bot was pondering on it, that search goes on instead."""
+		ponder, self.ponder = self.ponder, None
+		if ponder is not None and ponder.action == reply:
+			print('Ponder hit: ', cl.convert_to_uci_move(reply), ' -- already at depth', ponder.stats.depth)
+			ponder.hit(self.time_limit)
+			self.bot_stop, self.bot_queue = ponder.stop, self.ponder_queue
+		else:
+			if ponder is not None:
+				ponder.cancel()
+			self.bot_stop = threading.Event()
+			self.bot_queue = queue.Queue()
+			worker = threading.Thread(target=self.search_bot_move, args=(cl.Statecopy(self), self.tt, self.bot_stop, self.bot_queue), daemon=True)
+			worker.start()
+		self.window.after(BOT_POLL_INTERVAL, self.poll_bot, self.bot_queue)
+
+	def search_bot_move(self, new_state, tt, stop, results):
+		"""Worker thread: search new_state with transposition table tt, posting ('progress', stats, move) after every depth and ('move', stats, move) at the end."""
+		chessbotgame = cl.ChessGame()
 		# algorithm = self.cbo.get()
 		# if algorithm and algorithm == "Alpha beta pruning search":
-		move = alpha_beta_cutoff_search(
-			state=new_state, game=chessbotgame, d=2, cutoff_test=None, eval_fn=None
+		stats = SearchStats(stop=stop)
+		move = iterative_deepening_search(
+			state=new_state, game=chessbotgame, time_limit=self.time_limit, tt=tt, stats=stats,
+			quiescence=Quiescence(), pruning=Pruning(),
+			progress=lambda stats, move: results.put(('progress', stats, move))
 		)
 		# elif algorithm and algorithm == "Monte Carlo Tree Search":
 		# 	move = monte_carlo_tree_search(state=new_state, game=chessbotgame, N=2)
+		if not stop.is_set():
+			results.put(('move', stats, move))
+
+	def poll_bot(self, results):
+		"""Show the bot's progress and play its move once the search is done."""
+		if results is not self.bot_queue:
+			return  # Cancelled by reset
+		while True:
+			try:
+				kind, stats, move = results.get_nowait()
+			except queue.Empty:
+				self.window.after(BOT_POLL_INTERVAL, self.poll_bot, results)
+				return
+			if kind == 'progress':
+				self.luot.config(text=f"Lượt chơi: Bot - độ sâu {stats.depth}, {cl.convert_to_uci_move(move)}, {stats.nps:.0f} nút/s")
+			else:
+				break
+		self.bot_stop = self.bot_queue = None
+		if move is None:
+			return
 		print('Bot search best move: ',move,' -- UCI:',cl.convert_to_uci_move(move))
+		print(f'Depth {stats.depth}, score {stats.score}, {stats.nodes} nodes ({stats.qnodes} quiescence) in {stats.elapsed:.2f}s ({stats.nps:.0f} nodes/s), PV:', ' '.join(cl.convert_to_uci_move(m) for m in stats.pv))
+		print(f'First-move cutoff rate: {stats.first_move_cutoff_rate:.2f}, transposition table: ', self.tt.stats())
 		start_square, end_square = move
 		self.update_board(start_square, end_square)
 		self.updateTurn()
 		self.draw_last_move(move)
 		self.reload()
+		if len(stats.pv) >= 2 and stats.pv[0] == move:
+			self.start_ponder(stats.pv[1])
+
+	def start_ponder(self, reply):
+		"""Search the position after the human's expected reply while they think."""
+		results = queue.Queue()
+		self.ponder_queue = results
+		self.ponder = Ponder(
+			cl.Statecopy(self), cl.ChessGame(), reply, tt=self.tt,
+			done=lambda stats, move: results.put(('move', stats, move)),
+			quiescence=Quiescence(), pruning=Pruning(),
+			progress=lambda stats, move: results.put(('progress', stats, move))
+		)
+
+	def cancel_bot(self):
+		"""Stop the bot's search, if one is running, without waiting for it to finish, and any pondering.
+		The bot's search may still write to self.tt for a moment, so the caller gives the next search a
+		new table; pondering is joined, so its table stays usable."""
+		if self.bot_stop is not None:
+			self.bot_stop.set()
+		self.bot_stop = self.bot_queue = None
+		if self.ponder is not None:
+			self.ponder.cancel()
+		self.ponder = self.ponder_queue = None
 
 	def updateTurn(self):
 		self.turn = 'b' if self.turn == 'w' else 'w'
@@ -332,8 +358,8 @@ class MainApp:
 		if self.board[ex][ey].lower()=='p' and (ex==7 or ex==0):
 			print('promote')
 			self.board[ex][ey] = "Q" if self.board[ex][ey].isupper() else "q"
-		chessbotgame = ChessGame()
-		new_state = Statecopy(self)
+		chessbotgame = cl.ChessGame()
+		new_state = cl.Statecopy(self)
 		if self.turn=="w":
 			self.luot.config(text="Lượt chơi: Bot")
 		else:
@@ -3,7 +3,7 @@ from streamlit_drawable_canvas import st_canvas
 from PIL import Image, ImageDraw, ImageFont
 import os
 import chess as cl
-from games4e import Game, alpha_beta_cutoff_search
+from games4e import iterative_deepening_search, Ponder, Pruning, Quiescence, SearchStats, TranspositionTable
 import copy
 import time
 
@@ -11,68 +11,14 @@ import time
 # Chessboard dimensions
 BOARD_SIZE = 480  # Size of the chessboard in pixels
 SQUARE_SIZE = BOARD_SIZE // 8
+# Seconds the bot may think per move
+BOT_TIME_LIMIT = 2.0
+# Seconds the bot may ponder on the player's time, so it stops if they leave the page
+PONDER_MAX_TIME = 30.0
 
 pieces_dict = {'P':'white_pawn', 'R':'white_rook', 'N':'white_knight', 'B':'white_bishop', 'Q':'white_queen', 'K':'white_king', 'p':'black_pawn', 'r':'black_rook', 'n':'black_knight', 'b':'black_bishop', 'q':'black_queen', 'k':'black_king'}
 
 
-class Statecopy:
-	def __init__(self, realstate):
-		self.board = copy.deepcopy(realstate.board)
-		self.turn = realstate.turn
-
-	def updateTurn(self):
-		self.turn = 'b' if self.turn == 'w' else 'w'
-
-	def update_board(self, start, end):
-		sx, sy = start
-		ex, ey = end
-		self.board[ex][ey] = self.board[sx][sy]
-		self.board[sx][sy] = '.'
-		#check promotion
-		if self.board[ex][ey].lower()=='p' and (ex==7 or ex==0):
-			print('promote')
-			self.board[ex][ey] = "Q" if self.board[ex][ey].isupper() else "q"
-
-
-class ChessGame(Game):
-
-	def actions(self, state):
-		"""
-		Return all legal moves in the current state.
-		"""
-		return list(cl.generate_legal_moves(state))
-
-	def result(self, state, move):
-		"""
-		Return the new state after applying the move.
-		"""
-		start, end = move
-		
-		new_state = Statecopy(state)
-		new_state.update_board(start, end)
-		new_state.updateTurn()
-		return new_state
-
-	def utility(self, state, player):
-		"""
-		Define a utility function: positive for white, negative for black.
-		"""
-		# Use a simple evaluation based on material
-		score = cl.evaluate_board(state.board)
-		return score if player=='w' else -score
-
-	def terminal_test(self, state):
-		"""
-		Check if the game is over.
-		"""
-		return not self.actions(state)
-
-	def to_move(self, state):
-		"""
-		Return the player whose turn it is to move.
-		"""
-		return state.turn
-
 class EngineBoard:
 	def __init__(self):
 		self.board = self.initialize_board()
@@ -206,6 +152,10 @@ if "board_engine" not in st.session_state:
 	bengine = EngineBoard()
 	st.session_state["board_engine"] = bengine
 
+# Transposition table kept between bot moves
+if "tt" not in st.session_state:
+	st.session_state["tt"] = TranspositionTable(megabytes=64)
+
 if "board_image" not in st.session_state:
 	st.session_state["board_image"] = create_chessboard()
 	st.session_state["board_image_clear"] = copy.deepcopy(st.session_state["board_image"])
@@ -220,10 +170,13 @@ with col1:
 	if st.button("Reset board"):
 		bengine = EngineBoard()
 		print("button reset")
+		if st.session_state.get("ponder") is not None:
+			st.session_state["ponder"].cancel()
 		st.cache_data.clear()
 		st.session_state.clear()
 		st.cache_resource.clear()
 		st.session_state["board_engine"] = bengine
+		st.session_state["tt"] = TranspositionTable(megabytes=64)
 		st.session_state["board_image"] = create_chessboard()
 		st.session_state["board_image_clear"] = copy.deepcopy(st.session_state["board_image"])
 		st.session_state["diem"] = 1
@@ -241,23 +194,44 @@ def move_piece(pos1, pos2):
 	if engine.is_valid_move(pos1, pos2):
 		engine.updateTurn()
 		engine.update_board(pos1, pos2)
+		st.session_state["reply"] = (pos1, pos2)
 		load_piece(pos1, pos2)
 
 def play_bot():
 	engine = st.session_state["board_engine"]
 	print("play bot")
-	chessbotgame = ChessGame()
-	new_state = Statecopy(engine)
+	chessbotgame = cl.ChessGame()
+	new_state = cl.Statecopy(engine)
 	move = None
-	move = alpha_beta_cutoff_search(
-		state=new_state, game=chessbotgame, d=2, cutoff_test=None, eval_fn=None
-	)
+	# Carry on the search made while the player thought if they played the expected reply
+	ponder = st.session_state.pop("ponder", None)
+	if ponder is not None and ponder.action == st.session_state.get("reply"):
+		print("ponder hit, already at depth", ponder.stats.depth)
+		ponder.hit(BOT_TIME_LIMIT)
+		move = ponder.join()
+		stats = ponder.stats
+	else:
+		if ponder is not None:
+			ponder.cancel()
+		stats = SearchStats()
+		move = iterative_deepening_search(
+			state=new_state, game=chessbotgame, time_limit=BOT_TIME_LIMIT, tt=st.session_state["tt"], stats=stats,
+			quiescence=Quiescence(), pruning=Pruning()
+		)
+	print(f"Depth {stats.depth}, {stats.nodes} nodes ({stats.qnodes} quiescence) in {stats.elapsed:.2f}s ({stats.nps:.0f} nodes/s), first-move cutoff rate {stats.first_move_cutoff_rate:.2f}")
+	print("Transposition table:", st.session_state["tt"].stats())
 	start, end = move
 	row, col = start
 	piecesstr = pieces_dict[engine.board[row][col]]
 	engine.update_board(start, end)
 	engine.updateTurn()
 	load_piece(start, end)
+	# Think about the expected reply until the player moves
+	if len(stats.pv) >= 2 and stats.pv[0] == move:
+		st.session_state["ponder"] = Ponder(
+			cl.Statecopy(engine), chessbotgame, stats.pv[1], tt=st.session_state["tt"], max_time=PONDER_MAX_TIME,
+			quiescence=Quiescence(), pruning=Pruning()
+		)
 	return piecesstr, move
 
 	
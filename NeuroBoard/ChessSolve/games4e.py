@@ -1,17 +1,58 @@
 """Games or Adversarial Search (Chapter 5)"""
 
+import atexit
 import copy
 import itertools
+import multiprocessing
 import random
+import struct
+import threading
+import time
+from array import array
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
 
 import numpy as np
 
-from utils4e import vector_add, MCT_Node, ucb
+from utils4e import vector_add
 
 GameState = namedtuple('GameState', 'to_move, utility, board, moves')
 StochasticGameState = namedtuple('StochasticGameState', 'to_move, utility, board, moves, chance')
 
+# Settings for the quiescence search run at the leaves of alpha_beta_cutoff_search
+# and pvs_search:
+# delta_margin is the slack (in eval_fn units) a capture gets before delta pruning
+# drops it, check_evasions says whether a side in check searches all its moves
+# instead of standing pat, and max_depth caps the plies searched past the leaf.
+Quiescence = namedtuple('Quiescence', 'delta_margin, check_evasions, max_depth', defaults=(200, True, 8))
+
+# Settings for the selective search in pvs_search: null-move pruning and late
+# move reductions (lmr), with their reductions and minimum depths, and futility,
+# reverse futility and razoring, with margins in eval_fn units for depth 1, 2, ...
+Pruning = namedtuple('Pruning', 'null_move, null_move_reduction, null_move_min_depth, '
+                                'lmr, lmr_reduction, lmr_min_depth, lmr_min_moves, '
+                                'futility, futility_margins, reverse_futility, reverse_futility_margins, '
+                                'razoring, razor_margins',
+                     defaults=(True, 2, 3, True, 1, 3, 3, True, (200, 500), True, (150, 300, 450), True, (300, 600)))
+
+# Settings for the random playouts of monte_carlo_tree_search. A playout stops
+# after max_plies moves (None plays on to the end of the game, so it suits only
+# games that always end; others set a game.default_rollout) and the position
+# it reaches is then scored from game.utility as the win probability
+# 1 / (1 + 10 ** (-utility / eval_scale)), so eval_scale is the utility lead
+# that makes a win ten times likelier than a loss. For a game with
+# playouts(states, max_plies), which plays out many states at once, batch > 1
+# picks that many leaves at a time (with a virtual loss on the path to each) and
+# plays them out in one call.
+Rollout = namedtuple('Rollout', 'max_plies, eval_scale, batch', defaults=(None, 400, 1))
+
+# Score of being checkmated now, far beyond any evaluation, for games with
+# in_check. A mate n plies from the root scores MATE - n, so the searches prefer
+# the nearest mate and put off being mated; any score past MATE_BOUND is a mate.
+MATE = 100000
+MATE_BOUND = MATE - 1000
+
 
 # ______________________________________________________________________________
 # MinMax Search
@@ -127,33 +168,254 @@ def alpha_beta_search(state, game):
     return best_action
 
 
-def alpha_beta_cutoff_search(state, game, d=4, cutoff_test=None, eval_fn=None):
+def mate_score(game, state, ply):
+    """Score, for the player to move, of a state without legal moves in a game
+    with in_check, ply plies from the root: checkmate or stalemate (a draw)."""
+    return -MATE + ply if game.in_check(state) else 0
+
+
+def score_to_tt(score, ply):
+    """Make a mate score count from the node ply plies from the root instead of
+    from the root, so a table entry holds for the position wherever it is met."""
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    """Undo score_to_tt for a position met ply plies from the root."""
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def _ordered_moves(game, state, ordering, first, ply):
+    """The legal moves of state in search order: by ordering if given, else with
+    first (the move stored in the table), if legal, in front."""
+    actions = game.actions(state)
+    if ordering is not None:
+        return ordering.order(state, actions, first, ply)
+    if first is not None and first in actions:
+        return [first] + [a for a in actions if a != first]
+    return actions
+
+
+def _quiescence_moves(game, state, quiescence, qdepth, in_check=None):
+    """Return (moves quiescence search tries at qdepth, whether the side to move
+    is evading check): all moves in check if in_check is given, else the
+    captures, most valuable first by capture_score."""
+    if in_check is not None and qdepth < quiescence.max_depth and in_check(state):
+        return game.actions(state), True
+    if qdepth >= quiescence.max_depth:
+        return [], False
+    captures = game.captures(state)
+    capture_score = getattr(game, 'capture_score', None)
+    if capture_score is not None:
+        captures.sort(key=lambda a: capture_score(state, a), reverse=True)
+    return captures, False
+
+
+def _delta_pruned(game, state, a, quiescence, stand_pat, alpha):
+    """Whether capture a cannot lift stand_pat above alpha, both for the side to
+    move, even with quiescence.delta_margin to spare (needs capture_value)."""
+    capture_value = getattr(game, 'capture_value', None)
+    return capture_value is not None and stand_pat + capture_value(state, a) + quiescence.delta_margin <= alpha
+
+
+def alpha_beta_cutoff_search(state, game, d=4, cutoff_test=None, eval_fn=None, tt=None, stats=None,
+                             ordering=None, quiescence=None, alpha=-np.inf, root_actions=None, workers=1,
+                             shared_alpha=None):
     """Search game to determine best action; use alpha-beta pruning.
-    This version cuts off search and uses an evaluation function."""
+    This version cuts off search and uses an evaluation function.
+    tt: TranspositionTable for positions already searched (needs game.hash_key).
+    stats: SearchStats counting the nodes; SearchTimeout is raised past its budget.
+    ordering: MoveOrdering for the moves at each node.
+    quiescence: Quiescence, to search captures (game.captures) past depth d.
+    alpha: the root score to beat; None is returned if no move beats it.
+    root_actions: the root moves to search, instead of all of them.
+    workers: processes to split the root moves across (needs game.serialize).
+    shared_alpha: an alpha other searches raise meanwhile (a Value's raw object)."""
 
     player = game.to_move(state)
+    # Play moves on state and take them back, instead of building new states
+    in_place = hasattr(game, 'make_move')
+    use_tt = tt is not None and hasattr(game, 'hash_key')
+    parallel = workers > 1 and hasattr(game, 'serialize')
+    if parallel:
+        # Sent to the worker processes, so cutoff_test and eval_fn must be picklable
+        worker_options = dict(cutoff_test=cutoff_test, eval_fn=eval_fn, quiescence=quiescence)
+    use_quiescence = quiescence is not None and hasattr(game, 'captures')
+    # Without moves, a side in check is mated and any other stalemated (see mate_score)
+    mates = hasattr(game, 'in_check')
+    if use_quiescence:
+        # In check (with check_evasions) every move is searched instead of standing pat
+        in_check = getattr(game, 'in_check', None) if quiescence.check_evasions else None
+
+    def value(child_value, state, a, alpha, beta, depth):
+        """Score the child reached by playing a, with make/unmake when available."""
+        if in_place:
+            undo = game.make_move(state, a)
+            try:
+                return child_value(state, alpha, beta, depth)
+            finally:
+                game.unmake_move(state, undo)
+        return child_value(game.result(state, a), alpha, beta, depth)
+
+    def tt_lookup(key, depth, alpha, beta, sign):
+        """Return (value if the table settles this node, else None; stored best move).
+        sign is +1 where player is to move and -1 where the opponent is, since the
+        table keeps scores from the side to move's point of view."""
+        entry = tt.probe(key)
+        if entry is None:
+            return None, None
+        draft, score, bound, move = entry
+        if draft >= d - depth + 1:
+            score = sign * score_from_tt(score, depth)
+            if sign < 0 and bound != EXACT:
+                bound = LOWER + UPPER - bound
+            if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                return score, move
+        return None, move
+
+    def tt_save(key, depth, v, alpha, beta, sign, move):
+        """Store the value v found with window (alpha, beta) at this node."""
+        if v <= alpha:
+            bound = UPPER
+        elif v >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        if sign < 0 and bound != EXACT:
+            bound = LOWER + UPPER - bound
+        tt.store(key, d - depth + 1, score_to_tt(sign * v, depth), bound, move)
+
+    def cutoff(state, a, i, depth):
+        """Record that a, the i-th move searched at this node, caused a cutoff."""
+        if ordering is not None:
+            ordering.cutoff(state, a, depth, d - depth + 1)
+        if stats is not None:
+            stats.cutoffs += 1
+            if i == 0:
+                stats.first_move_cutoffs += 1
+
+    def leaf_value(value_fn, state, alpha, beta, depth, sign):
+        """Score a node where cutoff_test stopped the search. The node has been
+        counted already, so quiescence counts it only as a qnode. sign is +1
+        where player is to move and -1 where the opponent is."""
+        if use_quiescence and depth > d:
+            return value_fn(state, alpha, beta, 0)
+        if mates and depth <= d and not game.actions(state):
+            return sign * mate_score(game, state, depth)
+        return eval_fn(state)
+
+    def quiesce_max(state, alpha, beta, qdepth):
+        if stats is not None:
+            stats.qnodes += 1
+            if qdepth:
+                stats.visit()
+        stand_pat = eval_fn(state)
+        actions, evading = _quiescence_moves(game, state, quiescence, qdepth, in_check)
+        if evading:
+            if not actions:
+                return mate_score(game, state, d + 1 + qdepth)
+            v = -np.inf
+        else:
+            if stand_pat >= beta:
+                return stand_pat
+            v = stand_pat
+            alpha = max(alpha, v)
+        for a in actions:
+            if not evading and _delta_pruned(game, state, a, quiescence, stand_pat, alpha):
+                continue
+            v = max(v, value(quiesce_min, state, a, alpha, beta, qdepth + 1))
+            if v >= beta:
+                return v
+            alpha = max(alpha, v)
+        return v
+
+    def quiesce_min(state, alpha, beta, qdepth):
+        if stats is not None:
+            stats.qnodes += 1
+            if qdepth:
+                stats.visit()
+        stand_pat = eval_fn(state)
+        actions, evading = _quiescence_moves(game, state, quiescence, qdepth, in_check)
+        if evading:
+            if not actions:
+                return -mate_score(game, state, d + 1 + qdepth)
+            v = np.inf
+        else:
+            if stand_pat <= alpha:
+                return stand_pat
+            v = stand_pat
+            beta = min(beta, v)
+        for a in actions:
+            if not evading and _delta_pruned(game, state, a, quiescence, -stand_pat, -beta):
+                continue
+            v = min(v, value(quiesce_max, state, a, alpha, beta, qdepth + 1))
+            if v <= alpha:
+                return v
+            beta = min(beta, v)
+        return v
 
     # Functions used by alpha_beta
     def max_value(state, alpha, beta, depth):
+        if stats is not None:
+            stats.visit()
         if cutoff_test(state, depth):
-            return eval_fn(state)
+            return leaf_value(quiesce_max, state, alpha, beta, depth, 1)
+        first = None
+        if use_tt:
+            key = game.hash_key(state)
+            v, first = tt_lookup(key, depth, alpha, beta, 1)
+            if v is not None:
+                return v
+            alpha0 = alpha
         v = -np.inf
-        for a in game.actions(state):
-            v = max(v, min_value(game.result(state, a), alpha, beta, depth + 1))
+        best = None
+        for i, a in enumerate(_ordered_moves(game, state, ordering, first, depth)):
+            child = value(min_value, state, a, alpha, beta, depth + 1)
+            if child > v:
+                v, best = child, a
             if v >= beta:
-                return v
+                cutoff(state, a, i, depth)
+                break
             alpha = max(alpha, v)
+        if use_tt:
+            tt_save(key, depth, v, alpha0, beta, 1, best)
         return v
 
     def min_value(state, alpha, beta, depth):
+        if stats is not None:
+            stats.visit()
         if cutoff_test(state, depth):
-            return eval_fn(state)
+            return leaf_value(quiesce_min, state, alpha, beta, depth, -1)
+        first = None
+        if use_tt:
+            key = game.hash_key(state)
+            v, first = tt_lookup(key, depth, alpha, beta, -1)
+            if v is not None:
+                return v
+            beta0 = beta
         v = np.inf
-        for a in game.actions(state):
-            v = min(v, max_value(game.result(state, a), alpha, beta, depth + 1))
+        best = None
+        for i, a in enumerate(_ordered_moves(game, state, ordering, first, depth)):
+            if shared_alpha is not None and depth == 1:
+                # Only here, where beta is infinite, does a raised alpha keep every bound sound
+                alpha = max(alpha, shared_alpha.value)
+            child = value(max_value, state, a, alpha, beta, depth + 1)
+            if child < v:
+                v, best = child, a
             if v <= alpha:
-                return v
+                cutoff(state, a, i, depth)
+                break
             beta = min(beta, v)
+        if use_tt:
+            tt_save(key, depth, v, alpha, beta0, -1, best)
         return v
 
 
@@ -161,67 +423,1240 @@ def alpha_beta_cutoff_search(state, game, d=4, cutoff_test=None, eval_fn=None):
     # The default test cuts off at depth d or at a terminal state
     cutoff_test = (cutoff_test or (lambda state, depth: depth > d or game.terminal_test(state)))
     eval_fn = eval_fn or (lambda state: game.utility(state, player))
-    best_score = -np.inf
+    best_score = alpha
     beta = np.inf
     best_action = None
-    for a in game.actions(state):
-        v = min_value(game.result(state, a), best_score, beta, 1)
-        if v > best_score:
-            best_score = v
+    first = None
+    if use_tt:
+        key = game.hash_key(state)
+        entry = tt.probe(key)
+        if entry is not None:
+            first = entry[3]
+    actions = root_actions if root_actions is not None else _ordered_moves(game, state, ordering, first, 0)
+    if parallel and len(actions) > 1:
+        # The first move, the most likely best, is searched here to give the workers an alpha
+        best_score = value(min_value, state, actions[0], best_score, beta, 1)
+        if best_score > alpha:
+            best_action = actions[0]
+        a, best_score = _root_split(state, game, d, actions[1:], max(alpha, best_score), stats, worker_options,
+                                    workers)
+        if a is not None:
             best_action = a
+    else:
+        for a in actions:
+            v = value(min_value, state, a, best_score, beta, 1)
+            if v > best_score:
+                best_score = v
+                best_action = a
+    if use_tt and best_action is not None and root_actions is None:
+        tt.store(key, d + 1, best_score, EXACT, best_action)
+    if stats is not None:
+        stats.score = best_score
+    return best_action
+
+
+# Process pools kept between searches so that a search does not pay for starting
+# processes: (pool, shared object) by (initializer, number of workers)
+_pools = {}
+
+
+def _pool(initializer, workers, make_shared=None):
+    """Return the pool of workers processes started with initializer(shared), and
+    shared, made by make_shared() (or None) when the pool was started."""
+    if (initializer, workers) not in _pools:
+        shared = make_shared() if make_shared is not None else None
+        pool = ProcessPoolExecutor(workers, initializer=initializer, initargs=(shared,))
+        _pools[initializer, workers] = pool, shared
+    return _pools[initializer, workers]
+
+
+@atexit.register
+def _close_pools():
+    for pool, _ in _pools.values():
+        pool.shutdown(cancel_futures=True)
+    _pools.clear()
+
+
+# Set in each worker process of a root split by _root_split_init
+_root_split_worker = {}
+
+
+def _root_split_init(shared):
+    shared_alpha, stop = shared
+    _root_split_worker.update(alpha=shared_alpha, stop=stop, game_type=None)
+
+
+def _root_split_search(game, text, a, d, budget, max_nodes, options):
+    """Worker task: search root move a of the serialized state, with the shared
+    best score as alpha, for at most budget seconds and max_nodes nodes or until
+    the shared stop is set. Return (score, or None if the move is no better than
+    that alpha, nodes, qnodes)."""
+    worker = _root_split_worker
+    shared_alpha = worker['alpha']
+    if worker['game_type'] is not type(game):
+        worker.update(game_type=type(game), tt=TranspositionTable(), ordering=MoveOrdering(game))
+    state = game.deserialize(text)
+    deadline = time.perf_counter() + budget if budget is not None else None
+    stats = SearchStats(deadline, max_nodes, stop=worker['stop'])
+    # Read without the lock: a stale alpha only costs pruning
+    if alpha_beta_cutoff_search(state, game, d, tt=worker['tt'], stats=stats, ordering=worker['ordering'],
+                                alpha=shared_alpha.value, root_actions=[a], shared_alpha=shared_alpha.get_obj(),
+                                **options) is None:
+        return None, stats.nodes, stats.qnodes
+    with shared_alpha.get_lock():
+        # A score raised meanwhile may leave this one only an upper bound
+        if stats.score <= shared_alpha.value:
+            return None, stats.nodes, stats.qnodes
+        shared_alpha.value = stats.score
+    return stats.score, stats.nodes, stats.qnodes
+
+
+def _root_split(state, game, d, actions, alpha, stats, options, workers):
+    """Search actions at the root of state across worker processes; return
+    (best action or None if none beats alpha, its score or alpha)."""
+    pool, (shared_alpha, stop) = _pool(_root_split_init, workers,
+                                       lambda: (multiprocessing.Value('d'), multiprocessing.Event()))
+    shared_alpha.value = alpha
+    stop.clear()
+    text = game.serialize(state)
+    budget = max_nodes = None
+    if stats is not None and stats.deadline is not None:
+        budget = stats.deadline - time.perf_counter()
+    if stats is not None and stats.max_nodes is not None:
+        max_nodes = stats.max_nodes - stats.nodes
+    best_score, best_action = alpha, None
+    futures = []
+    try:
+        futures = [pool.submit(_root_split_search, game, text, a, d, budget, max_nodes, options) for a in actions]
+        # A move may fail low against an alpha raised by a move after it, so when
+        # several moves share the best score, any of them may be the one returned
+        for a, future in zip(actions, futures):
+            if stats is not None and stats.stop is not None:
+                # Pass the caller's stop (perhaps a threading.Event) on to the workers
+                while not wait([future], timeout=0.01).done:
+                    if stats.stop.is_set():
+                        stop.set()
+            score, nodes, qnodes = future.result()
+            if stats is not None:
+                stats.nodes += nodes
+                stats.qnodes += qnodes
+            if score is not None and score > best_score:
+                best_score, best_action = score, a
+    finally:
+        # Tasks left running would raise the shared alpha of the next split
+        stop.set()
+        for future in futures:
+            future.cancel()
+        wait(futures)
+    return best_action, best_score
+
+
+def pvs_search(state, game, depth=4, alpha=-np.inf, beta=np.inf, eval_fn=None, tt=None, stats=None,
+               ordering=None, quiescence=None, pruning=None):
+    """Principal variation search: alpha_beta_cutoff_search in negamax form, with a
+    null window for every move but the first at a node. Scores must be integers.
+    depth: plies to search (d + 1 in alpha_beta_cutoff_search).
+    alpha, beta: the window at the root; a root score outside it is only a bound.
+    eval_fn: scores a state for the player to move at the root.
+    tt, stats, ordering, quiescence: as in alpha_beta_cutoff_search.
+    pruning: Pruning, for null moves, late move reductions and futility pruning."""
+
+    player = game.to_move(state)
+    in_place = hasattr(game, 'make_move')
+    use_tt = tt is not None and hasattr(game, 'hash_key')
+    use_quiescence = quiescence is not None and hasattr(game, 'captures')
+    capture_value = getattr(game, 'capture_value', None)
+    capture_score = getattr(game, 'capture_score', None)
+    in_check = getattr(game, 'in_check', None)
+    evasion_check = in_check if use_quiescence and quiescence.check_evasions else None
+    use_null_move = pruning is not None and pruning.null_move and in_place and hasattr(game, 'make_null_move')
+    use_lmr = pruning is not None and pruning.lmr
+    use_static_pruning = pruning is not None and (pruning.futility or pruning.reverse_futility or pruning.razoring)
+    non_pawn_material = getattr(game, 'has_non_pawn_material', None)
+    tactical = capture_value or capture_score
+    # Staged move generation finds a terminal node by its having no moves
+    staged = ordering is not None and ordering.can_stage
+    eval_fn = eval_fn or (lambda state: game.utility(state, player))
+    mates = in_check is not None
+
+    def terminal_value(state, ply, color):
+        """Value of a state without moves for the player to move there."""
+        return mate_score(game, state, ply) if mates else color * eval_fn(state)
+
+    def play(search, state, a, *args):
+        """Return search(child, *args) for the child reached by playing a."""
+        if in_place:
+            undo = game.make_move(state, a)
+            try:
+                return search(state, *args)
+            finally:
+                game.unmake_move(state, undo)
+        return search(game.result(state, a), *args)
+
+    def quiesce(state, alpha, beta, qdepth, color, ply):
+        if stats is not None:
+            stats.qnodes += 1
+            if qdepth:
+                stats.visit()
+        stand_pat = color * eval_fn(state)
+        actions, evading = _quiescence_moves(game, state, quiescence, qdepth, evasion_check)
+        if evading:
+            if not actions:
+                return mate_score(game, state, ply)
+            v = -np.inf
+        else:
+            if stand_pat >= beta:
+                return stand_pat
+            v = stand_pat
+            alpha = max(alpha, v)
+        for a in actions:
+            if not evading and _delta_pruned(game, state, a, quiescence, stand_pat, alpha):
+                continue
+            v = max(v, -play(quiesce, state, a, -beta, -alpha, qdepth + 1, -color, ply + 1))
+            if v >= beta:
+                return v
+            alpha = max(alpha, v)
+        return v
+
+    def search_moves(state, key, first, alpha, beta, depth, ply, color, checked, futility_value=None):
+        """Search the moves of state, first (the hash move) before the others;
+        return (value, best move) and store the result in the table. checked
+        tells whether the player to move is in check. Quiet moves other than the
+        first are skipped if futility_value, the most they are expected to score,
+        is at most alpha."""
+        if staged:
+            actions = ordering.staged(state, first, ply)
+        else:
+            actions = _ordered_moves(game, state, ordering, first, ply)
+        alpha0 = alpha
+        v = -np.inf
+        best = None
+        for i, a in enumerate(actions):
+            if i == 0:
+                child = -play(search, state, a, -beta, -alpha, depth - 1, ply + 1, -color)
+            else:
+                quiet = pruning is not None and (tactical is None or not tactical(state, a))
+                if quiet and futility_value is not None and futility_value <= alpha:
+                    if stats is not None:
+                        stats.futility_pruned += 1
+                    v = max(v, futility_value)
+                    continue
+                reduction = 0
+                if quiet and use_lmr and i >= pruning.lmr_min_moves and depth >= pruning.lmr_min_depth \
+                        and not checked:
+                    reduction = pruning.lmr_reduction
+                # A null window only proves the move no better; one that fails high is searched again
+                child = -play(search, state, a, -alpha - 1, -alpha, depth - 1 - reduction, ply + 1, -color)
+                if reduction:
+                    if stats is not None:
+                        stats.reductions += 1
+                    if child > alpha:
+                        if stats is not None:
+                            stats.reduction_researches += 1
+                        child = -play(search, state, a, -alpha - 1, -alpha, depth - 1, ply + 1, -color)
+                if alpha < child < beta:
+                    if stats is not None:
+                        stats.researches += 1
+                    child = -play(search, state, a, -beta, -alpha, depth - 1, ply + 1, -color)
+            if child > v:
+                v, best = child, a
+            if v >= beta:
+                if ordering is not None:
+                    ordering.cutoff(state, a, ply, depth)
+                if stats is not None:
+                    stats.cutoffs += 1
+                    if i == 0:
+                        stats.first_move_cutoffs += 1
+                break
+            alpha = max(alpha, v)
+        if best is None:
+            # No moves: a terminal state that staged generation found only now
+            return terminal_value(state, ply, color), None
+        if use_tt:
+            bound = UPPER if v <= alpha0 else LOWER if v >= beta else EXACT
+            tt.store(key, depth, score_to_tt(v, ply), bound, best)
+        return v, best
+
+    def search(state, alpha, beta, depth, ply, color, null_ok=True):
+        """Value of state for the player to move there; color is 1 if that is player, else -1.
+        null_ok is False right after a null move, so two are never played in a row."""
+        if stats is not None:
+            stats.visit()
+        if depth <= 0:
+            if use_quiescence:
+                return quiesce(state, alpha, beta, 0, color, ply)
+            return color * eval_fn(state)
+        if not staged and game.terminal_test(state):
+            return terminal_value(state, ply, color)
+        key = first = None
+        if use_tt:
+            key = game.hash_key(state)
+            entry = tt.probe(key)
+            if entry is not None:
+                draft, score, bound, first = entry
+                score = score_from_tt(score, ply)
+                if draft >= depth and (bound == EXACT or (bound == LOWER and score >= beta) or
+                                       (bound == UPPER and score <= alpha)):
+                    return score
+        # No pruning in check, and none but reductions outside null windows
+        checked = pruning is not None and in_check is not None and in_check(state)
+        futility_value = None
+        if use_static_pruning and not checked and beta - alpha == 1:
+            static = color * eval_fn(state)
+            # Reverse futility: even the evaluation less a margin beats beta
+            margins = pruning.reverse_futility_margins
+            if pruning.reverse_futility and depth <= len(margins) and static - margins[depth - 1] >= beta:
+                if stats is not None:
+                    stats.reverse_futility_pruned += 1
+                return static - margins[depth - 1]
+            # Razoring: far below alpha, return if quiescence confirms the node fails low
+            margins = pruning.razor_margins
+            if pruning.razoring and depth <= len(margins) and static + margins[depth - 1] <= alpha:
+                v = quiesce(state, alpha, beta, 0, color, ply) if use_quiescence else static
+                if v <= alpha:
+                    if stats is not None:
+                        stats.razored += 1
+                    return v
+            # Futility: quiet moves are skipped if the evaluation plus a margin cannot reach alpha
+            margins = pruning.futility_margins
+            if pruning.futility and depth <= len(margins):
+                futility_value = static + margins[depth - 1]
+        # Null move: if passing still beats beta, so would a move. Not with only pawns
+        # left, where zugzwang (passing being better than any move) is common
+        if use_null_move and null_ok and not checked and depth >= pruning.null_move_min_depth \
+                and beta - alpha == 1 and (non_pawn_material is None or non_pawn_material(state)):
+            undo = game.make_null_move(state)
+            try:
+                v = -search(state, -beta, -beta + 1, depth - 1 - pruning.null_move_reduction, ply + 1, -color,
+                            False)
+            finally:
+                game.unmake_null_move(state, undo)
+            if v >= beta:
+                if stats is not None:
+                    stats.null_move_cutoffs += 1
+                # A mate found after passing is not a mate the moves can force
+                return beta if v >= MATE_BOUND else v
+        return search_moves(state, key, first, alpha, beta, depth, ply, color, checked, futility_value)[0]
+
+    # Body of pvs_search starts here:
+    key = first = None
+    if use_tt:
+        key = game.hash_key(state)
+        entry = tt.probe(key)
+        if entry is not None:
+            first = entry[3]
+    checked = pruning is not None and in_check is not None and in_check(state)
+    best_score, best_action = search_moves(state, key, first, alpha, beta, depth, 0, 1, checked)
+    if stats is not None:
+        stats.score = best_score
     return best_action
 
 
+# ______________________________________________________________________________
+# Iterative deepening under a time budget
+
+
+class SearchTimeout(Exception):
+    """Raised inside a search when its time or node budget runs out."""
+
+
+class SearchStats:
+    """Counts the nodes a search visits and enforces its budget: visit raises
+    SearchTimeout once time.perf_counter() passes deadline, more than max_nodes
+    nodes have been visited, or stop (anything with an is_set method, such as a
+    threading or multiprocessing Event) is set. The clock and stop are checked
+    every check_every nodes.
+    Searches also leave their results here: depth completed, score and pv.
+    qnodes counts the nodes (already in nodes) that belong to quiescence search,
+    researches the null-window searches in pvs_search that failed high and were
+    searched again, and aspiration_researches the iterations searched again
+    because the score fell outside the aspiration window. null_move_cutoffs counts
+    the nodes pruned by a null move, reductions the moves searched with a late
+    move reduction and reduction_researches those of them searched again at full
+    depth. futility_pruned counts the moves skipped by futility pruning, and
+    reverse_futility_pruned and razored the nodes cut by those two."""
+
+    def __init__(self, deadline=None, max_nodes=None, check_every=256, stop=None):
+        self.start = time.perf_counter()
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.stop = stop
+        self.check_every = check_every
+        self.nodes = 0
+        self.qnodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.researches = 0
+        self.aspiration_researches = 0
+        self.null_move_cutoffs = 0
+        self.reductions = 0
+        self.reduction_researches = 0
+        self.futility_pruned = 0
+        self.reverse_futility_pruned = 0
+        self.razored = 0
+        self.depth = 0
+        self.score = None
+        self.pv = []
+
+    def visit(self):
+        self.nodes += 1
+        if self.nodes % self.check_every == 0:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeout
+            if self.stop is not None and self.stop.is_set():
+                raise SearchTimeout
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchTimeout
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def nps(self):
+        elapsed = self.elapsed
+        return self.nodes / elapsed if elapsed > 0 else 0
+
+    @property
+    def first_move_cutoff_rate(self):
+        """Share of cutoffs caused by the first move searched; near 1 when ordering works."""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+
+def principal_variation(state, game, tt, max_length=32):
+    """Follow the best moves stored in tt from state. Each move is checked against
+    game.actions, since another position may have overwritten the entry."""
+    pv = []
+    seen = set()
+    while len(pv) < max_length:
+        key = game.hash_key(state)
+        entry = tt.probe(key)
+        if key in seen or entry is None or entry[3] not in game.actions(state):
+            break
+        seen.add(key)
+        pv.append(entry[3])
+        state = game.result(state, entry[3])
+    return pv
+
+
+def iterative_deepening_search(state, game, time_limit=1.0, max_nodes=None, max_depth=64,
+                               eval_fn=None, tt=None, stats=None, ordering=None, quiescence=None,
+                               pruning=None, aspiration=50, progress=None):
+    """Search one ply deeper at a time with pvs_search until time_limit seconds
+    or max_nodes nodes are used up, and return the best move of the deepest
+    iteration that completed. The transposition table carries each iteration's
+    best moves, the principal variation included, into the next one as the moves
+    to search first. A new iteration is not started once half the time is gone,
+    since it would almost certainly not finish. quiescence and pruning are passed
+    on to pvs_search.
+    Every iteration after the first searches an aspiration window of aspiration
+    either side of the previous score, which prunes more than a full window. If
+    the score falls outside it, the iteration is searched again with a window
+    four times as wide, and after a few failures with the full window.
+    aspiration=None always searches the full window.
+    progress, if given, is called as progress(stats, action) after every
+    iteration that completes, with its best action; stats then holds its depth,
+    score and pv. anytime_search yields the same iterations one at a time."""
+    stats = stats if stats is not None else SearchStats()
+    actions = game.actions(state)
+    best_action = actions[0] if actions else None
+    if len(actions) <= 1:
+        return best_action
+    for result in anytime_search(state, game, time_limit, max_nodes, max_depth, eval_fn=eval_fn, tt=tt,
+                                 stats=stats, ordering=ordering, quiescence=quiescence, pruning=pruning,
+                                 aspiration=aspiration):
+        best_action = result.action
+        if progress is not None:
+            progress(stats, best_action)
+    return best_action
+
+
+# One completed iteration of anytime_search: its depth, score (for the side to
+# move) and principal variation, the nodes and seconds used by the whole search
+# so far, and the best action.
+SearchResult = namedtuple('SearchResult', 'depth, score, pv, nodes, elapsed, action')
+
+
+def anytime_search(state, game, time_limit=None, max_nodes=None, max_depth=64, stop=None, check_every=None,
+                   eval_fn=None, tt=None, stats=None, ordering=None, quiescence=None, pruning=None,
+                   aspiration=50):
+    """Generator form of iterative_deepening_search: yields a SearchResult after
+    every iteration that completes, so the caller always holds the best move found
+    so far. It ends when time_limit seconds or max_nodes nodes are used up,
+    max_depth is reached, or stop (anything with an is_set method, checked every
+    check_every nodes; by default stats' own setting) is set; the iteration cut
+    short is not yielded. The caller
+    may also just stop iterating. With time_limit=None only stop, max_nodes and
+    max_depth end it. A state without actions yields nothing."""
+    tt = tt if tt is not None else TranspositionTable()
+    ordering = ordering if ordering is not None else MoveOrdering(game)
+    ordering.new_search()
+    deadline = time.perf_counter() + time_limit if time_limit is not None else None
+    stats = stats if stats is not None else SearchStats()
+    stats.deadline, stats.max_nodes = deadline, max_nodes
+    if check_every is not None:
+        stats.check_every = check_every
+    if stop is not None:
+        stats.stop = stop
+    if not game.actions(state):
+        return
+    score = None
+    for depth in range(1, max_depth + 1):
+        window = aspiration if score is not None and np.isfinite(score) else None
+        try:
+            while True:
+                alpha, beta = (-np.inf, np.inf) if window is None else (score - window, score + window)
+                action = pvs_search(state, game, depth, alpha, beta, eval_fn=eval_fn, tt=tt, stats=stats,
+                                    ordering=ordering, quiescence=quiescence, pruning=pruning)
+                if window is None or alpha < stats.score < beta:
+                    break
+                stats.aspiration_researches += 1
+                window = window * 4 if window < aspiration * 16 else None
+        except SearchTimeout:
+            # Keep the score of the last iteration that completed
+            stats.score = score
+            return
+        score = stats.score
+        stats.depth = depth
+        stats.pv = principal_variation(state, game, tt, depth) if hasattr(game, 'hash_key') else [action]
+        yield SearchResult(depth, score, list(stats.pv), stats.nodes, stats.elapsed, action)
+        if deadline is not None and time.perf_counter() > deadline - time_limit / 2:
+            return
+
+
+class Ponder:
+    """Thinking on the opponent's time: iterative_deepening_search of the state
+    after the opponent's expected action (usually the second move of the last
+    principal variation) runs on a background thread until hit or cancel.
+    If the opponent plays action, hit turns it into the real search, already
+    some plies deep; otherwise cancel it and search the actual position, which
+    the ponder search has left in the shared tt.
+    Until hit, the search stops by itself after max_time seconds or at
+    max_depth, so that it does not run on when the opponent never moves.
+    done, if given, is called on the search thread as done(stats, move) once the
+    search returns, unless it was cancelled. Other keyword arguments (quiescence,
+    pruning, progress, ...) go to iterative_deepening_search."""
+
+    def __init__(self, state, game, action, tt, done=None, max_time=60.0, max_depth=64, **options):
+        self.action = action
+        self.done = done
+        self.stop = threading.Event()
+        self.stats = SearchStats(stop=self.stop)
+        self.move = None
+        self.cancelled = False
+        self.timer = None
+        if max_time is not None:
+            self.timer = threading.Timer(max_time, self.stop.set)
+            self.timer.daemon = True
+            self.timer.start()
+        self.thread = threading.Thread(target=self._search,
+                                       args=(game.result(state, action), game, tt, max_depth, options), daemon=True)
+        self.thread.start()
+
+    def _search(self, state, game, tt, max_depth, options):
+        self.move = iterative_deepening_search(state, game, time_limit=None, max_depth=max_depth, tt=tt,
+                                               stats=self.stats, **options)
+        if self.done is not None and not self.cancelled:
+            self.done(self.stats, self.move)
+
+    def hit(self, time_limit):
+        """The opponent played action: let the search go on for time_limit more
+        seconds. This does not wait; join (or done) gives the move."""
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = threading.Timer(time_limit, self.stop.set)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def join(self):
+        """Wait for the search to finish and return its move."""
+        self.thread.join()
+        return self.move
+
+    def cancel(self):
+        """The opponent played something else: stop the search and wait for it."""
+        self.cancelled = True
+        self.stop.set()
+        if self.timer is not None:
+            self.timer.cancel()
+        self.thread.join()
+
+
+# ______________________________________________________________________________
+# Move ordering
+
+
+class MoveOrdering:
+    """Orders the moves at each node of a search so the best move tends to come
+    first, which is what makes alpha-beta prune. The order is:
+    the hash move from the transposition table, then captures by MVV-LVA (most
+    valuable victim first, least valuable attacker breaking ties), then the two
+    killer moves of this ply (quiet moves that recently caused a cutoff at the
+    same depth), then the other quiet moves by their history score, which grows
+    each time the move causes a cutoff.
+
+    Captures are recognised through game.capture_score(state, move), which returns
+    a positive MVV-LVA score for captures and 0 for quiet moves. Games without
+    it have only quiet moves. Subclass and override order/cutoff to plug in a
+    different scheme.
+
+    If the game can generate its captures (captures(state), which includes
+    promotions for chess) and its other moves (quiet_moves(state)) separately,
+    and check a move from elsewhere with is_legal(state, move), staged yields the
+    moves in the same order while generating each group only when the search
+    gets to it; a cutoff on the hash move or a capture then saves generating
+    the quiet moves at all.
+
+    With a seed, quiet moves with the same history score come in a random order
+    drawn from it, so that searches of the same position can differ (see
+    lazy_smp_search)."""
+
+    HASH_MOVE = 1 << 30
+    CAPTURE = 1 << 24
+    KILLER = 1 << 23
+    HISTORY_LIMIT = 1 << 22
+
+    def __init__(self, game, max_ply=128, seed=None):
+        self.game = game
+        self.rng = random.Random(seed) if seed is not None else None
+        self.capture_score = getattr(game, 'capture_score', None)
+        self.can_stage = all(hasattr(game, name) for name in ('captures', 'quiet_moves', 'is_legal'))
+        self.max_ply = max_ply
+        self.killers = [[None, None] for _ in range(max_ply)]
+        self.history = {}
+
+    def new_search(self):
+        """Forget the killers and age the history before a new search."""
+        self.killers = [[None, None] for _ in range(self.max_ply)]
+        self.history = {a: h // 2 for a, h in self.history.items() if h > 1}
+
+    def order(self, state, actions, hash_move, ply):
+        """Return actions sorted best first."""
+        capture_score = self.capture_score
+        killers = self.killers[ply] if ply < self.max_ply else (None, None)
+        history = self.history
+        rng = self.rng
+
+        def score(a):
+            if a == hash_move:
+                return self.HASH_MOVE
+            if capture_score is not None:
+                victim = capture_score(state, a)
+                if victim:
+                    return self.CAPTURE + victim
+            if a == killers[0]:
+                return self.KILLER + 1
+            if a == killers[1]:
+                return self.KILLER
+            if rng is not None:
+                return history.get(a, 0) + rng.random()
+            return history.get(a, 0)
+
+        return sorted(actions, key=score, reverse=True)
+
+    def staged(self, state, hash_move, ply):
+        """Yield the legal moves of state best first, one stage at a time: the
+        hash move, captures by MVV-LVA, killers, then quiet moves by history.
+        The state may be changed between moves as long as it is restored."""
+        game = self.game
+        searched = []
+        if hash_move is not None and game.is_legal(state, hash_move):
+            searched.append(hash_move)
+            yield hash_move
+        captures = game.captures(state)
+        if self.capture_score is not None:
+            captures.sort(key=lambda a: self.capture_score(state, a), reverse=True)
+        for a in captures:
+            if a != hash_move:
+                yield a
+        if ply < self.max_ply:
+            for a in self.killers[ply]:
+                if a is not None and a not in searched and a not in captures and game.is_legal(state, a):
+                    searched.append(a)
+                    yield a
+        history = self.history
+        quiets = [a for a in game.quiet_moves(state) if a not in searched]
+        if self.rng is not None:
+            self.rng.shuffle(quiets)
+        quiets.sort(key=lambda a: history.get(a, 0), reverse=True)
+        yield from quiets
+
+    def is_quiet(self, state, a):
+        return self.capture_score is None or not self.capture_score(state, a)
+
+    def cutoff(self, state, a, ply, depth):
+        """Update killers and history after a caused a cutoff with depth plies left."""
+        if not self.is_quiet(state, a):
+            return
+        if ply < self.max_ply:
+            killers = self.killers[ply]
+            if killers[0] != a:
+                killers[1] = killers[0]
+                killers[0] = a
+        h = self.history.get(a, 0) + depth * depth
+        self.history[a] = h
+        if h > self.HISTORY_LIMIT:
+            self.history = {m: v // 2 for m, v in self.history.items()}
+
+
+# ______________________________________________________________________________
+# Transposition table
+
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class TranspositionTable:
+    """A fixed-size cache of search results, keyed by a 64-bit position hash
+    (game.hash_key). Each entry holds the key, the depth searched below the
+    position, the score, the bound type (EXACT, LOWER or UPPER) and the best move.
+    Scores are from the point of view of the side to move in that position.
+
+    Entries live in buckets of two slots. The first slot is depth-preferred: it
+    is only replaced by a search at least as deep. The second is always replaced.
+    Deep results survive, and recent shallow ones are still cached."""
+
+    # Bytes per slot: key, score, depth, bound and a reference to the move
+    ENTRY_BYTES = 8 + 8 + 2 + 1 + 8
+
+    def __init__(self, megabytes=16):
+        buckets = self.bucket_count(megabytes)
+        self.mask = buckets - 1
+        self.size = 2 * buckets
+        self.clear()
+
+    @classmethod
+    def bucket_count(cls, megabytes):
+        """The largest power of two number of buckets that fits in megabytes."""
+        buckets = 1
+        while buckets * 4 * cls.ENTRY_BYTES <= megabytes * 2 ** 20:
+            buckets *= 2
+        return buckets
+
+    def clear(self):
+        """Forget every entry and reset the counters."""
+        size = self.size
+        self.keys = array('Q', bytes(8 * size))
+        self.scores = array('d', bytes(8 * size))
+        self.depths = array('h', [-1]) * size
+        self.bounds = array('B', bytes(size))
+        self.moves = [None] * size
+        self.hits = self.misses = self.overwrites = 0
+
+    def probe(self, key):
+        """Return (depth, score, bound, move) stored for key, or None."""
+        i = (key & self.mask) << 1
+        keys = self.keys
+        depths = self.depths
+        if keys[i] != key or depths[i] < 0:
+            i += 1
+            if keys[i] != key or depths[i] < 0:
+                self.misses += 1
+                return None
+        self.hits += 1
+        return depths[i], self.scores[i], self.bounds[i], self.moves[i]
+
+    def store(self, key, depth, score, bound, move):
+        i = (key & self.mask) << 1
+        depths = self.depths
+        keys = self.keys
+        if keys[i] != key and depth < depths[i]:
+            i += 1  # The depth-preferred slot holds a deeper search of another position
+        if depths[i] < 0:
+            pass
+        elif keys[i] != key:
+            self.overwrites += 1
+        elif move is None:
+            move = self.moves[i]
+        keys[i] = key
+        depths[i] = depth
+        self.scores[i] = score
+        self.bounds[i] = bound
+        self.moves[i] = move
+
+    def stats(self):
+        """Probe and store counters since the last clear."""
+        probes = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses, overwrites=self.overwrites,
+                    hit_rate=self.hits / probes if probes else 0.0)
+
+
+_pack_word = struct.Struct('<Q').pack
+_unpack_word = struct.Struct('<Q').unpack
+_pack_double = struct.Struct('<d').pack
+_unpack_double = struct.Struct('<d').unpack
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """A TranspositionTable in a multiprocessing.shared_memory block, so that
+    several search processes can probe and store into the same table at once.
+
+    Each slot is a fixed-width record of three 64-bit words: the score (the bits
+    of a double), a word packing depth + 1, the bound and the move code + 1, and
+    the key XORed with the other two. There are no locks: a slot that one
+    process reads while another writes it comes out with a key that does not
+    match, and counts as a miss. The replacement scheme is the one of
+    TranspositionTable.
+
+    Moves are stored as integers, so the game must implement encode_move(move)
+    and decode_move(code). The process that creates the table (name=None) owns
+    the block and should unlink it when done; a table pickled to another
+    process, or built with the block's name, attaches to the same memory."""
+
+    # Bytes per slot: three words
+    ENTRY_BYTES = 3 * 8
+
+    def __init__(self, game, megabytes=16, name=None):
+        buckets = self.bucket_count(megabytes)
+        self.game = game
+        self.megabytes = megabytes
+        self.mask = buckets - 1
+        self.size = 2 * buckets
+        self.encode_move = game.encode_move
+        self.decode_move = game.decode_move
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=self.size * self.ENTRY_BYTES)
+        self.words = self.shm.buf.cast('Q')
+        self.hits = self.misses = self.overwrites = 0
+        if self.owner:
+            self.clear()
+
+    def __reduce__(self):
+        return self.__class__, (self.game, self.megabytes, self.shm.name)
+
+    def clear(self):
+        """Forget every entry (in every process) and reset this process's counters."""
+        self.shm.buf[:] = bytes(self.size * self.ENTRY_BYTES)
+        self.hits = self.misses = self.overwrites = 0
+
+    def close(self):
+        """Detach this process from the table."""
+        self.words.release()
+        self.shm.close()
+
+    def unlink(self):
+        """Free the shared memory; call once, from the owner, after every process has closed it."""
+        self.shm.unlink()
+
+    def probe(self, key):
+        """Return (depth, score, bound, move) stored for key, or None."""
+        words = self.words
+        i = (key & self.mask) * 6
+        for j in (i, i + 3):
+            score, meta = words[j], words[j + 1]
+            if meta and words[j + 2] ^ score ^ meta == key:
+                self.hits += 1
+                code = meta >> 24
+                move = self.decode_move(code - 1) if code else None
+                return (meta & 0xFFFF) - 1, _unpack_double(_pack_word(score))[0], meta >> 16 & 0xFF, move
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        words = self.words
+        i = (key & self.mask) * 6
+        meta = words[i + 1]
+        slot_key = words[i + 2] ^ words[i] ^ meta
+        if slot_key != key and depth < (meta & 0xFFFF) - 1:
+            i += 3  # The depth-preferred slot holds a deeper search of another position
+            meta = words[i + 1]
+            slot_key = words[i + 2] ^ words[i] ^ meta
+        code = self.encode_move(move) + 1 if move is not None else 0
+        if not meta:
+            pass
+        elif slot_key != key:
+            self.overwrites += 1
+        elif move is None:
+            code = meta >> 24
+        score = _unpack_word(_pack_double(score))[0]
+        meta = (depth + 1) | bound << 16 | code << 24
+        words[i] = score
+        words[i + 1] = meta
+        words[i + 2] = key ^ score ^ meta
+
+
+# Set in each helper process of lazy_smp_search by _lazy_smp_init
+_lazy_smp_stop = None
+
+
+def _lazy_smp_init(stop):
+    global _lazy_smp_stop
+    _lazy_smp_stop = stop
+
+
+def _lazy_smp_helper(game, text, tt, seed, time_limit, max_depth, options):
+    """Helper task of lazy_smp_search: search the serialized state until the
+    main search stops; return the nodes searched."""
+    stats = SearchStats(stop=_lazy_smp_stop)
+    try:
+        iterative_deepening_search(game.deserialize(text), game, time_limit, max_depth=max_depth, tt=tt,
+                                   stats=stats, ordering=MoveOrdering(game, seed=seed), **options)
+    finally:
+        tt.close()
+    return stats.nodes
+
+
+def lazy_smp_search(state, game, time_limit=1.0, max_depth=64, workers=2, tt=None, stats=None, **options):
+    """Lazy SMP: workers - 1 helper processes run iterative_deepening_search on
+    the same state while this process does too, all sharing one
+    SharedTranspositionTable. The helpers have differently seeded move orders,
+    so they tend to search different parts of the tree first, and what they
+    store there saves the main search work. The main search's move is returned;
+    the helpers are stopped when it finishes, and their nodes are added to stats.
+    The helper processes are kept for later searches with as many workers.
+    The game must implement serialize/deserialize and encode_move/decode_move.
+    Without tt, a table is created for this search and freed afterwards. Other
+    keyword arguments (quiescence, pruning, ...) go to iterative_deepening_search."""
+    own_tt = tt is None
+    if own_tt:
+        tt = SharedTranspositionTable(game)
+    stats = stats if stats is not None else SearchStats()
+    text = game.serialize(state)
+    pool = stop = None
+    if workers > 1:
+        pool, stop = _pool(_lazy_smp_init, workers - 1, multiprocessing.Event)
+        stop.clear()
+    helpers = []
+    try:
+        for seed in range(1, workers):
+            helpers.append(pool.submit(_lazy_smp_helper, game, text, tt, seed, time_limit, max_depth, options))
+        move = iterative_deepening_search(state, game, time_limit, max_depth=max_depth, tt=tt, stats=stats,
+                                          **options)
+    finally:
+        if stop is not None:
+            stop.set()
+        for helper in helpers:
+            stats.nodes += helper.result()
+        if own_tt:
+            tt.close()
+            tt.unlink()
+    return move
+
+
 # ______________________________________________________________________________
 # Monte Carlo Tree Search
 
 
-def monte_carlo_tree_search(state, game, N=1000):
-    def select(n):
-        """select a leaf node in the tree"""
-        if n.children:
-            return select(max(n.children.keys(), key=ucb))
+class MCTSTree:
+    """Monte Carlo search tree stored as a struct of arrays, indexed by node
+    number with the root at 0: parent, N (visits), U (wins of the player who
+    moved into the node, a draw counting half), first_child and child_count
+    (the children of a node have consecutive numbers, higher than their
+    parent's), and the action leading to each node. first_child is -1 until a
+    node is expanded. A node's state is only made, by node_state, when the
+    search first gets to it; until then it is None. The arrays double in size
+    when they fill up.
+    The search keeps the tree below max_nodes nodes (None: no bound) by pruning
+    the least visited subtrees. Keep the tree between moves and reroot it on the
+    moves played to reuse what it learned (see MCTSPlayer)."""
+
+    def __init__(self, state, capacity=1024, max_nodes=100000):
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.N = np.zeros(capacity)
+        self.U = np.zeros(capacity)
+        self.first_child = np.full(capacity, -1, dtype=np.int32)
+        self.child_count = np.zeros(capacity, dtype=np.int32)
+        self.action = [None]
+        self.state = [state]
+        self.size = 1
+        self.max_nodes = max_nodes
+        self.widest = 0  # Most children of any node, the most one expand adds
+
+    def __len__(self):
+        return self.size
+
+    def children(self, node):
+        """The numbers of node's children, as a range."""
+        first = self.first_child[node]
+        return range(first, first + self.child_count[node]) if first >= 0 else range(0)
+
+    def expand(self, node, actions):
+        """Add the children of node reached by actions, without their states."""
+        first = self.size
+        self.size += len(actions)
+        if self.size > len(self.N):
+            self._grow(self.size)
+        self.parent[first:self.size] = node
+        self.first_child[node] = first
+        self.child_count[node] = len(actions)
+        self.widest = max(self.widest, len(actions))
+        self.action.extend(actions)
+        self.state.extend([None] * len(actions))
+
+    def node_state(self, node, game):
+        """The state of node, made from its parent's on first use."""
+        state = self.state[node]
+        if state is None:
+            state = self.state[node] = game.result(self.state[self.parent[node]], self.action[node])
+        return state
+
+    def select_child(self, node, C=1.4):
+        """The child of node with the highest UCB1 score, computed for all of them
+        at once; the first child not yet visited, if there is one."""
+        first = self.first_child[node]
+        end = first + self.child_count[node]
+        n = self.N[first:end]
+        i = n.argmin()
+        if n[i] > 0:
+            i = (self.U[first:end] / n + C * np.sqrt(np.log(self.N[node]) / n)).argmax()
+        return first + int(i)
+
+    def backprop(self, path, reward):
+        """Count a visit to every node on path (from the root down) and credit
+        wins, reward being the win probability of the player who moved into the
+        last node; each level up the tree sees it from the other side."""
+        path = np.asarray(path)
+        own = np.arange(len(path)) % 2 == (len(path) - 1) % 2
+        self.N[path] += 1
+        self.U[path] += np.where(own, reward, 1 - reward)
+
+    def best_action(self):
+        """The action of the root's most visited child."""
+        children = self.children(0)
+        return self.action[children[int(self.N[children.start:children.stop].argmax())]]
+
+    def reroot(self, state, actions):
+        """Make the node that actions (the moves played since the last search)
+        lead to from the root the new root, with state, keeping its subtree and
+        dropping the rest. If the tree does not reach it, start over from state."""
+        node = 0
+        for action in actions:
+            node = next((child for child in self.children(node) if self.action[child] == action), None)
+            if node is None:
+                self.__init__(state, len(self.N), self.max_nodes)
+                return
+        self.state[node] = state
+        self._compact(node)
+
+    def prune(self, target):
+        """Take the children off the least visited expanded nodes, dropping their
+        subtrees, until the tree has at most target nodes (or only the root's
+        children are left)."""
+        size = np.ones(self.size, dtype=np.int64)
+        for node in range(self.size - 1, 0, -1):
+            size[self.parent[node]] += size[node]
+        live = size[0]
+        expanded = np.flatnonzero(self.first_child[1:self.size] >= 0) + 1
+        for node in expanded[np.argsort(self.N[expanded], kind='stable')]:
+            if live <= target:
+                break
+            ancestor = self.parent[node]
+            while ancestor > 0 and self.first_child[ancestor] >= 0:
+                ancestor = self.parent[ancestor]
+            if ancestor > 0:
+                continue  # Already dropped with an ancestor
+            freed = size[node] - 1
+            live -= freed
+            self.first_child[node] = -1
+            self.child_count[node] = 0
+            ancestor = node
+            while ancestor >= 0:
+                size[ancestor] -= freed
+                ancestor = self.parent[ancestor]
+        self._compact(0)
+
+    def _compact(self, root):
+        """Renumber the subtree under root breadth first, from 0, and forget
+        every other node."""
+        order = [root]
+        parent = [-1]
+        first_child = [-1]
+        i = 0
+        while i < len(order):
+            first = self.first_child[order[i]]
+            if first >= 0:
+                count = self.child_count[order[i]]
+                first_child[i] = len(order)
+                order.extend(range(first, first + count))
+                parent.extend([i] * count)
+                first_child.extend([-1] * count)
+            i += 1
+        old = np.array(order)
+        size = len(order)
+        self.N[:size] = self.N[old]
+        self.U[:size] = self.U[old]
+        self.child_count[:size] = self.child_count[old]
+        self.parent[:size] = parent
+        self.first_child[:size] = first_child
+        self.parent[size:self.size] = -1
+        self.first_child[size:self.size] = -1
+        self.child_count[size:self.size] = 0
+        self.N[size:self.size] = 0
+        self.U[size:self.size] = 0
+        self.action = [None] + [self.action[node] for node in order[1:]]
+        self.state = [self.state[node] for node in order]
+        self.size = size
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self.N))
+        for name, fill in (('parent', -1), ('N', 0), ('U', 0), ('first_child', -1), ('child_count', 0)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+
+def mcts_playout(game, state, rollout):
+    """Win probability of a random playout from state, for the player who moved
+    into it, as monte_carlo_tree_search plays them (see there)."""
+    max_plies = rollout.max_plies
+    random_move = getattr(game, 'random_move', None)
+    in_check = getattr(game, 'in_check', None)
+    make_move = getattr(game, 'make_move', None)
+    player = game.to_move(state)
+    copied = False
+    plies = 0
+    while max_plies is None or plies < max_plies:
+        if random_move is not None:
+            action = random_move(state)
+            if action is None:
+                if in_check is None or not in_check(state):
+                    return 0.5
+                return 1.0 if game.to_move(state) == player else 0.0
         else:
-            return n
-
-    def expand(n):
-        """expand the leaf node by adding all its children states"""
-        if not n.children and not game.terminal_test(n.state):
-            n.children = {MCT_Node(state=game.result(n.state, action), parent=n): action
-                          for action in game.actions(n.state)}
-        return select(n)
-
-    def simulate(game, state):
-        """simulate the utility of current state by random picking a step"""
-        player = game.to_move(state)
-        while not game.terminal_test(state):
+            if game.terminal_test(state):
+                v = game.utility(state, player)
+                return 0.0 if v > 0 else 1.0 if v < 0 else 0.5
             action = random.choice(list(game.actions(state)))
+        if copied:
+            make_move(state, action)
+        else:
             state = game.result(state, action)
-        v = game.utility(state, player)
-        return -v
+            copied = make_move is not None
+        plies += 1
+    return 1 / (1 + 10 ** (game.utility(state, player) / rollout.eval_scale))
+
+
+def mcts_playouts(game, states, rollout):
+    """mcts_playout of every state at once, through game.playouts, which returns
+    (values, ended) for the player to move: 1, -1 or 0 for a game won, lost or
+    drawn, and the utility reached for a game cut off after max_plies."""
+    values, ended = game.playouts(states, rollout.max_plies)
+    with np.errstate(over='ignore'):
+        win = np.where(ended, (values + 1) / 2, 1 / (1 + 10 ** (-values / rollout.eval_scale)))
+    return 1 - win
+
+
+def monte_carlo_tree_search(state, game, N=1000, C=1.4, rollout=None, tree=None, workers=1, parallel='root'):
+    """Run N playouts from state, each one going down the tree by UCB1 (with
+    exploration constant C), adding the children of the leaf it reaches and
+    playing randomly from the first of them, as set by rollout (see Rollout; by
+    default game.default_rollout if the game has one, else to the end of the
+    game); return the action tried most often at the root.
+    To reuse the statistics of an earlier search, pass the MCTSTree it used as
+    tree, rerooted on the moves played since. A new tree is made otherwise; its
+    size is bounded by tree.max_nodes.
+    Games with random_move(state), which returns a random legal move or None
+    when there is none, are played out with it instead of game.actions and
+    terminal_test; a player left without a move has lost if in_check says so
+    and drawn otherwise. Games with make_move are played out in place, on one
+    copy of the state.
+    With workers > 1 the playouts run on that many processes. parallel='root'
+    has each build its own tree with an equal share of N (this process searching
+    tree) and adds up the root's visit counts. parallel='leaf' keeps one tree
+    here and plays out workers leaves at a time on a process pool; a virtual
+    loss on the path to each leaf of a batch steers the next ones elsewhere.
+    The processes are kept for later searches with as many workers.
+    States are sent to the workers serialized if the game has serialize and
+    deserialize, pickled otherwise. Without workers, rollout.batch leaves at a
+    time are played out together by game.playouts, if the game has it."""
+    rollout = rollout if rollout is not None else getattr(game, 'default_rollout', Rollout())
+    tree = tree if tree is not None else MCTSTree(state)
+    if workers > 1 and parallel == 'root':
+        return _mcts_root_parallel(state, game, N, C, rollout, tree, workers)
+    pool = None
+    batched = False
+    size = 1
+    if workers > 1:
+        pool, _ = _pool(_mcts_init, workers)
+        size = workers
+    elif rollout.batch > 1 and hasattr(game, 'playouts'):
+        batched = True
+        size = rollout.batch
+    done = 0
+    while done < N:
+        batch = min(size, N - done)
+        if tree.max_nodes is not None and len(tree) + batch * tree.widest > tree.max_nodes:
+            tree.prune(tree.max_nodes // 2)
+        leaves = []
+        for _ in range(batch):
+            # select a leaf node in the tree
+            node = 0
+            path = [0]
+            while tree.first_child[node] >= 0:
+                node = tree.select_child(node, C)
+                path.append(node)
+            # expand the leaf node by adding all its children
+            leaf_state = tree.node_state(node, game)
+            if not game.terminal_test(leaf_state):
+                tree.expand(node, list(game.actions(leaf_state)))
+                node = tree.select_child(node, C)
+                path.append(node)
+                leaf_state = tree.node_state(node, game)
+            if size > 1:
+                tree.N[path] += 1  # Virtual loss, until the playout is back
+            leaves.append((path, leaf_state))
+        if pool is not None:
+            packed = [_pack_state(game, leaf_state) for _, leaf_state in leaves]
+            rewards = pool.map(_mcts_playout_task, itertools.repeat(game), itertools.repeat(rollout), packed)
+        elif batched:
+            rewards = mcts_playouts(game, [leaf_state for _, leaf_state in leaves], rollout)
+        else:
+            rewards = [mcts_playout(game, leaf_state, rollout) for _, leaf_state in leaves]
+        for (path, _), reward in zip(leaves, rewards):
+            if size > 1:
+                tree.N[path] -= 1
+            tree.backprop(path, reward)
+        done += batch
+    return tree.best_action()
+
+
+def _mcts_init(_):
+    # Forked workers would otherwise all play the same random playouts
+    random.seed()
+
+
+def _pack_state(game, state):
+    return game.serialize(state) if hasattr(game, 'serialize') else state
 
-    def backprop(n, utility):
-        """passing the utility back to all parent nodes"""
-        if utility > 0:
-            n.U += utility
-        # if utility == 0:
-        #     n.U += 0.5
-        n.N += 1
-        if n.parent:
-            backprop(n.parent, -utility)
 
-    root = MCT_Node(state=state)
+def _unpack_state(game, packed):
+    return game.deserialize(packed) if hasattr(game, 'deserialize') else packed
 
-    for _ in range(N):
-        print('for ')
-        leaf = select(root)
-        child = expand(leaf)
-        result = simulate(game, child.state)
-        backprop(child, result)
 
-    max_state = max(root.children, key=lambda p: p.N)
+def _mcts_playout_task(game, rollout, packed):
+    """Worker task of a leaf-parallel search: one playout from the state."""
+    return mcts_playout(game, _unpack_state(game, packed), rollout)
 
-    return root.children.get(max_state)
+
+def _mcts_root_task(game, rollout, packed, N, C):
+    """Worker task of a root-parallel search: N playouts on a tree of its own;
+    return the (action, visits) of every root child."""
+    state = _unpack_state(game, packed)
+    tree = MCTSTree(state)
+    monte_carlo_tree_search(state, game, N, C, rollout, tree)
+    return [(tree.action[child], tree.N[child]) for child in tree.children(0)]
+
+
+def _mcts_root_parallel(state, game, N, C, rollout, tree, workers):
+    """Root parallelization for monte_carlo_tree_search: workers - 1 processes
+    and this one search their own trees; return the action with the most visits
+    over all of them."""
+    packed = _pack_state(game, state)
+    pool, _ = _pool(_mcts_init, workers - 1)
+    futures = []
+    try:
+        futures = [pool.submit(_mcts_root_task, game, rollout, packed, N // workers, C) for _ in range(workers - 1)]
+        monte_carlo_tree_search(state, game, N - (workers - 1) * (N // workers), C, rollout, tree)
+        visits = {tree.action[child]: tree.N[child] for child in tree.children(0)}
+        for future in futures:
+            for action, n in future.result():
+                visits[action] = visits.get(action, 0) + n
+    finally:
+        # Leave the pool free for the next search
+        for future in futures:
+            future.cancel()
+    return max(visits, key=visits.get)
 
 
 # ______________________________________________________________________________
@@ -263,6 +1698,40 @@ def mcts_player(game, state):
     return monte_carlo_tree_search(state, game)
 
 
+class MCTSPlayer:
+    """A player like mcts_player that keeps its MCTSTree between moves, rerooted
+    on its last move and the reply to it, so the playouts made there count
+    again. Use a new one for each game."""
+
+    def __init__(self, N=1000, C=1.4, rollout=None, max_nodes=100000):
+        self.N, self.C, self.rollout, self.max_nodes = N, C, rollout, max_nodes
+        self.tree = None
+        self.move = None
+
+    def __call__(self, game, state):
+        path = self._path(game, state) if self.tree is not None else None
+        if path is None:
+            self.tree = MCTSTree(state, max_nodes=self.max_nodes)
+        else:
+            self.tree.reroot(state, path)
+        self.move = monte_carlo_tree_search(state, game, self.N, self.C, self.rollout, self.tree)
+        return self.move
+
+    def _path(self, game, state):
+        """The actions from the tree's root to state (this player's move and the
+        reply), or None if the tree does not have them."""
+        tree = self.tree
+        node = next((child for child in tree.children(0) if tree.action[child] == self.move), None)
+        if node is None:
+            return None
+        key = getattr(game, 'hash_key', None)
+        for reply in tree.children(node):
+            reply_state = tree.node_state(reply, game)
+            if (key(reply_state) == key(state)) if key is not None else reply_state == state:
+                return [self.move, tree.action[reply]]
+        return None
+
+
 # ______________________________________________________________________________
 # Some Sample Games
 
@@ -274,7 +1743,20 @@ class Game:
     result, utility, and terminal_test. You may override display and
     successors or you can inherit their default methods. You will also
     need to set the .initial attribute to the initial state; this can
-    be done in the constructor."""
+    be done in the constructor.
+
+    A game with mutable states can also define make_move(state, move), which
+    changes state in place and returns undo information, and
+    unmake_move(state, undo); searches that support it then skip the state
+    copy that result makes at every node. A game that defines hash_key(state),
+    a 64-bit hash of the position, can be searched with a TranspositionTable.
+    The searches look for more optional methods: capture_score for MoveOrdering,
+    captures, capture_value and in_check for quiescence search, and
+    make_null_move/unmake_null_move and has_non_pawn_material for null-move
+    pruning (see Pruning). serialize(state) and deserialize(text), which turn a
+    state into a compact string and back, let a search send states to other
+    processes. random_move(state) and playouts(states, max_plies) speed up the
+    playouts of monte_carlo_tree_search (see there and Rollout)."""
 
     def actions(self, state):
         """Return a list of the allowable moves at this point."""
@@ -483,6 +1965,56 @@ class ConnectFour(TicTacToe):
         return [(x, y) for (x, y) in state.moves
                 if y == 1 or (x, y - 1) in state.board]
 
+    def playouts(self, states, max_plies=None):
+        """Random playouts from all the states at once, for Rollout.batch. The
+        boards are one (K, h, v) array, +1 for X and -1 for O, with a border of
+        k - 1 empty squares so lines can be checked without bounds tests, and
+        every step drops a piece in a random open column of each game still
+        going. Return (values, ended) for the player to move in each state: 1,
+        -1 or 0 for a win, loss or draw, and 0 for a game cut off after max_plies."""
+        count = len(states)
+        border = self.k - 1
+        boards = np.zeros((count, self.h + 2 * border, self.v + 2 * border), dtype=np.int8)
+        for i, state in enumerate(states):
+            for (x, y), player in state.board.items():
+                boards[i, x - 1 + border, y - 1 + border] = 1 if player == 'X' else -1
+        heights = (boards != 0).sum(axis=2)[:, border:border + self.h]
+        starts = np.array([1 if state.to_move == 'X' else -1 for state in states], dtype=np.int8)
+        turns = starts.copy()
+        ended = np.array([self.terminal_test(state) for state in states], dtype=bool)
+        values = np.array([self.utility(state, state.to_move) for state in states], dtype=float)
+        games = np.arange(count)
+        rng = np.random.default_rng()
+        plies = 0
+        while (max_plies is None or plies < max_plies) and not ended.all():
+            active = games[~ended]
+            keys = np.where(heights[active] < self.v, rng.random((len(active), self.h)), -1)
+            cols = keys.argmax(axis=1)
+            rows = heights[active, cols]
+            boards[active, cols + border, rows + border] = turns[active]
+            heights[active, cols] += 1
+            won = self._k_in_row_batch(boards[active], cols + border, rows + border, turns[active])
+            values[active[won]] = np.where(turns[active[won]] == starts[active[won]], 1, -1)
+            ended[active[won | (heights[active].sum(axis=1) == self.h * self.v)]] = True
+            turns[active] = -turns[active]
+            plies += 1
+        return values, ended
+
+    def _k_in_row_batch(self, boards, xs, ys, players):
+        """k_in_row for many boards at once: whether the piece just put on
+        (xs[i], ys[i]) of boards[i] makes a line of k for players[i]. The boards
+        need a border of k - 1 empty squares. The k - 1 squares each way along
+        the four lines are read in one go, as a (K, 4, 2, k - 1) array."""
+        steps = np.arange(1, self.k)
+        directions = np.array([(0, 1), (1, 0), (1, -1), (1, 1)])[:, None, :] * np.array([1, -1])[None, :, None]
+        dx = directions[:, :, None, 0] * steps
+        dy = directions[:, :, None, 1] * steps
+        games = np.arange(len(boards))[:, None, None, None]
+        same = boards[games, xs[:, None, None, None] + dx, ys[:, None, None, None] + dy] == players[:, None, None, None]
+        # Squares in a row from the new piece: the run of matches before the first miss
+        lengths = np.cumprod(same, axis=3).sum(axis=3)
+        return (1 + lengths.sum(axis=2) >= self.k).any(axis=1)
+
 
 class Backgammon(StochasticGame):
     """A two player game where the goal of each player is to move all the
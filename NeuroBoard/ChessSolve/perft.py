@@ -0,0 +1,136 @@
+"""
+Perft: count the leaf nodes of the legal move tree to a fixed depth.
+
+It checks the move generator against known node counts and is the speed
+benchmark for any move generator change:
+
+	python perft.py                            # reference suite up to depth 3
+	python perft.py --depth 4                  # reference suite up to depth 4
+	python perft.py --fen "<fen>" --depth 4    # one position
+	python perft.py --depth 4 --divide         # node count per root move
+	python perft.py --depth 4 --workers 4      # root moves split across processes
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bitboard as bb
+import chess as cl
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1'
+
+# The usual perft test positions with their node counts for depth 1, 2, 3...
+# The counts follow this engine's rules: no castling, no en passant, and pawns
+# only promote to queens. Where none of those come up, they equal the published
+# numbers (the start position up to depth 4 and position 6). All of them were
+# checked against python-chess, an independent move generator, with the castling
+# rights cleared and en passant captures and underpromotions left out of its
+# legal moves.
+REFERENCE_POSITIONS = [
+	('start position', START_FEN, [20, 400, 8902, 197281, 4865351]),
+	('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w - - 0 1', [46, 1865, 86585, 3488552]),
+	('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2810, 43087, 671300]),
+	('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w - - 0 1', [6, 222, 7855, 305965]),
+	('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w - - 1 8', [40, 1339, 51750, 1729274]),
+	('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10', [46, 2079, 89890, 3894594]),
+]
+
+
+def perft(position, depth):
+	"""Count the leaf nodes depth plies below position."""
+	if depth == 0:
+		return 1
+	moves = position.generate_legal_moves()
+	if depth == 1:
+		return len(moves)
+	nodes = 0
+	for move in moves:
+		undo = position.make_move(move)
+		nodes += perft(position, depth - 1)
+		position.unmake_move(undo)
+	return nodes
+
+
+def divide(position, depth):
+	"""Return (move, leaf nodes) for every root move."""
+	counts = []
+	for move in position.generate_legal_moves():
+		undo = position.make_move(move)
+		counts.append((move, perft(position, depth - 1)))
+		position.unmake_move(undo)
+	return counts
+
+
+def _perft_after(fen, move, depth):
+	"""Worker task: perft of the position reached by playing move."""
+	position = bb.Position.from_fen(fen)
+	position.make_move(move)
+	return perft(position, depth)
+
+
+def parallel_divide(fen, depth, workers):
+	"""divide, with the root moves spread over a pool of worker processes."""
+	moves = bb.Position.from_fen(fen).generate_legal_moves()
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		counts = pool.map(_perft_after, [fen] * len(moves), moves, [depth - 1] * len(moves))
+		return list(zip(moves, counts))
+
+
+def run(fen, depth, workers=1):
+	"""Return (per root move counts, seconds taken)."""
+	start = time.perf_counter()
+	if workers > 1 and depth > 1:
+		counts = parallel_divide(fen, depth, workers)
+	else:
+		counts = divide(bb.Position.from_fen(fen), depth)
+	return counts, time.perf_counter() - start
+
+
+def report(label, depth, nodes, elapsed, status=''):
+	nps = nodes / elapsed if elapsed > 0 else 0
+	print(f"{label:<16} depth {depth}  nodes {nodes:>9}  {elapsed:7.2f}s  {nps:>10.0f} nps  {status}")
+
+
+def run_suite(max_depth, workers=1):
+	"""Run every reference position up to max_depth; return True if all counts match."""
+	ok = True
+	total_nodes = 0
+	total_time = 0
+	for name, fen, expected in REFERENCE_POSITIONS:
+		for depth in range(1, min(max_depth, len(expected)) + 1):
+			counts, elapsed = run(fen, depth, workers)
+			nodes = sum(count for _, count in counts)
+			total_nodes += nodes
+			total_time += elapsed
+			passed = nodes == expected[depth - 1]
+			ok = ok and passed
+			report(name, depth, nodes, elapsed, 'ok' if passed else f'FAIL, expected {expected[depth - 1]}')
+	report('total', max_depth, total_nodes, total_time)
+	return ok
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Perft node counts for the bitboard move generator.")
+	parser.add_argument('--fen', help="position to count instead of the reference suite")
+	parser.add_argument('--depth', type=int, default=3, help="depth to count to (maximum depth for the suite)")
+	parser.add_argument('--divide', action='store_true', help="print the node count under every root move")
+	parser.add_argument('--workers', type=int, default=1, help="processes to split the root moves across")
+	args = parser.parse_args(argv)
+	if args.depth < 1:
+		parser.error("depth must be at least 1")
+
+	if args.fen is None and not args.divide:
+		return 0 if run_suite(args.depth, args.workers) else 1
+
+	fen = args.fen or START_FEN
+	counts, elapsed = run(fen, args.depth, args.workers)
+	if args.divide:
+		for move, count in counts:
+			print(f"{cl.convert_to_uci_move(move)}: {count}")
+	report('perft', args.depth, sum(count for _, count in counts), elapsed)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
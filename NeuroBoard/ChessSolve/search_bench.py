@@ -0,0 +1,235 @@
+"""
+Search benchmark: nodes and time the bot's search needs to reach a fixed depth.
+
+Every search variant runs on the same positions with a fresh transposition
+table and move ordering, so the node counts show what each change to the
+search saves:
+
+	python search_bench.py                             # depth 4 on the reference positions
+	python search_bench.py --depth 5 --fen "<fen>"     # one position
+	python search_bench.py --search pvs                # only some of the variants
+	python search_bench.py --match lmr pvs --games 10  # self-play between two variants
+	python search_bench.py --smp                       # Lazy SMP with 1, 2, 4 and 8 workers
+	python search_bench.py --time 5                    # every iteration finished in 5 seconds
+	python search_bench.py --mcts 2000                 # MCTS playouts/s with 1, 2, 4 and 8 workers or batched
+
+A match plays pairs of games from the same randomly played opening, each
+variant taking white once, and every move is searched to --depth.
+"""
+import argparse
+import random
+import sys
+import time
+from functools import partial
+
+import bitboard as bb
+import chess as cl
+import games4e as g4
+from perft import REFERENCE_POSITIONS, START_FEN
+
+
+def iterate_alpha_beta(position, game, depth, stats, workers=1):
+	"""The search before principal variation search: alpha_beta_cutoff_search with
+	a full window, iterated one ply deeper at a time."""
+	tt = g4.TranspositionTable()
+	ordering = g4.MoveOrdering(game)
+	move = None
+	for d in range(depth):
+		move = g4.alpha_beta_cutoff_search(position, game, d=d, tt=tt, stats=stats, ordering=ordering,
+			quiescence=g4.Quiescence(), workers=workers)
+	return move
+
+
+def iterate_pvs(position, game, depth, stats, **options):
+	return g4.iterative_deepening_search(position, game, time_limit=None, max_depth=depth, stats=stats,
+		quiescence=g4.Quiescence(), **options)
+
+
+NO_PRUNING = g4.Pruning(null_move=False, lmr=False, futility=False, reverse_futility=False, razoring=False)
+
+# name: function(position, game, depth, stats) returning the best move
+SEARCHES = {
+	'alpha-beta': iterate_alpha_beta,
+	'alpha-beta-4-workers': partial(iterate_alpha_beta, workers=4),
+	'pvs': partial(iterate_pvs, aspiration=None),
+	'pvs+aspiration': iterate_pvs,
+	'null-move': partial(iterate_pvs, pruning=NO_PRUNING._replace(null_move=True)),
+	'lmr': partial(iterate_pvs, pruning=NO_PRUNING._replace(lmr=True)),
+	'null-move+lmr': partial(iterate_pvs, pruning=NO_PRUNING._replace(null_move=True, lmr=True)),
+	'futility': partial(iterate_pvs, pruning=NO_PRUNING._replace(futility=True)),
+	'reverse-futility': partial(iterate_pvs, pruning=NO_PRUNING._replace(reverse_futility=True)),
+	'razoring': partial(iterate_pvs, pruning=NO_PRUNING._replace(razoring=True)),
+	'all-pruning': partial(iterate_pvs, pruning=g4.Pruning()),
+}
+
+# SearchStats counters reported for the pruning techniques, when not zero
+PRUNING_COUNTERS = ['null_move_cutoffs', 'reductions', 'reduction_researches', 'futility_pruned',
+	'reverse_futility_pruned', 'razored']
+
+
+def run(search, fen, depth):
+	"""Return (move, stats) of one search of fen to depth."""
+	position = bb.Position.from_fen(fen, cl.square_scores_by_index)
+	stats = g4.SearchStats()
+	move = SEARCHES[search](position, cl.ChessGame(), depth, stats)
+	return move, stats
+
+
+def play_game(white, black, opening, depth, max_plies=200):
+	"""Play one game between two variants after the opening moves; return
+	(white's score of 1, 0.5 or 0, nodes searched by white, nodes searched by black).
+	A game still going after max_plies is scored as a draw."""
+	position = bb.Position.from_fen(START_FEN, cl.square_scores_by_index)
+	for move in opening:
+		position.make_move(move)
+	nodes = {'w': 0, 'b': 0}
+	for _ in range(max_plies):
+		if not position.generate_legal_moves():
+			if not position.in_check():
+				return 0.5, nodes['w'], nodes['b']
+			return (0 if position.turn == 'w' else 1), nodes['w'], nodes['b']
+		search = white if position.turn == 'w' else black
+		stats = g4.SearchStats()
+		move = SEARCHES[search](position.copy(), cl.ChessGame(), depth, stats)
+		nodes[position.turn] += stats.nodes
+		position.make_move(move)
+	return 0.5, nodes['w'], nodes['b']
+
+
+def match(first, second, games, depth, opening_plies=4, seed=0):
+	"""Play games between two variants and print the score of the first."""
+	rng = random.Random(seed)
+	score = 0
+	nodes = {first: 0, second: 0}
+	for i in range(0, games, 2):
+		position = bb.Position.from_fen(START_FEN)
+		opening = []
+		for _ in range(opening_plies):
+			move = rng.choice(position.generate_legal_moves())
+			position.make_move(move)
+			opening.append(move)
+		for white, black in ((first, second), (second, first))[:games - i]:
+			result, white_nodes, black_nodes = play_game(white, black, opening, depth)
+			score += result if white == first else 1 - result
+			nodes[white] += white_nodes
+			nodes[black] += black_nodes
+			print(f"{white} - {black}: {result}-{1 - result}")
+	print(f"{first} {score}/{games} against {second}; nodes {nodes[first]} against {nodes[second]}")
+
+
+def report(label, search, move, stats):
+	move = cl.convert_to_uci_move(move) if move else '-'
+	print(f"{label:<16} {search:<20} {move:<6} score {stats.score!s:>6}  nodes {stats.nodes:>9}"
+		f"  qnodes {stats.qnodes:>9}  {stats.elapsed:7.2f}s  {stats.nps:>8.0f} nps")
+	counters = [f"{name} {getattr(stats, name)}" for name in PRUNING_COUNTERS if getattr(stats, name)]
+	if counters:
+		print(' ' * 38, ', '.join(counters))
+
+
+def smp_scaling(positions, depth, worker_counts=(1, 2, 4, 8)):
+	"""Print the time lazy_smp_search takes to reach depth on the positions, and
+	the nodes per second of all its processes together, for each worker count."""
+	game = cl.ChessGame()
+	for workers in worker_counts:
+		nodes = 0
+		elapsed = 0
+		for name, fen in positions:
+			stats = g4.SearchStats()
+			start = time.perf_counter()
+			g4.lazy_smp_search(game.deserialize(fen), game, time_limit=None, max_depth=depth, workers=workers,
+				stats=stats, quiescence=g4.Quiescence(), pruning=g4.Pruning())
+			elapsed += time.perf_counter() - start
+			nodes += stats.nodes
+		print(f"{workers} workers  time to depth {depth} {elapsed:7.2f}s  nodes {nodes:>9}  {nodes / elapsed:>8.0f} nps")
+
+
+def stream(positions, time_limit):
+	"""Print every iteration anytime_search completes on the positions within time_limit seconds."""
+	game = cl.ChessGame()
+	for name, fen in positions:
+		for result in g4.anytime_search(game.deserialize(fen), game, time_limit, quiescence=g4.Quiescence(),
+				pruning=g4.Pruning()):
+			pv = ' '.join(cl.convert_to_uci_move(move) for move in result.pv)
+			print(f"{name:<16} depth {result.depth:>2}  score {result.score!s:>6}  nodes {result.nodes:>9}"
+				f"  {result.elapsed:7.2f}s  pv {pv}")
+
+
+# Playouts of chess MCTS stop after this many moves and are scored by the evaluation
+MCTS_ROLLOUT = g4.Rollout(max_plies=20)
+
+
+def mcts_scaling(positions, playouts, worker_counts=(1, 2, 4, 8), batch_sizes=(16, 64, 256)):
+	"""Print the playouts per second of monte_carlo_tree_search, root and leaf
+	parallel, on the chess positions and on ConnectFour, for each worker count,
+	and then in one process with playouts batched on NumPy arrays."""
+	connect_four = g4.ConnectFour()
+	game = cl.ChessGame()
+	problems = [(name, game, game.deserialize(fen), MCTS_ROLLOUT) for name, fen in positions]
+	problems.append(('connect four', connect_four, connect_four.initial, g4.Rollout()))
+	for parallel in ('root', 'leaf'):
+		for workers in worker_counts:
+			for name, problem, state, rollout in problems:
+				start = time.perf_counter()
+				move = g4.monte_carlo_tree_search(state, problem, playouts, rollout=rollout, workers=workers,
+					parallel=parallel)
+				elapsed = time.perf_counter() - start
+				move = cl.convert_to_uci_move(move) if problem is game else str(move)
+				print(f"{name:<16} {parallel:<4} {workers} workers  {move:<6}  {elapsed:7.2f}s"
+					f"  {playouts / elapsed:>8.0f} playouts/s")
+	for batch in batch_sizes:
+		for name, problem, state, rollout in problems:
+			start = time.perf_counter()
+			move = g4.monte_carlo_tree_search(state, problem, playouts, rollout=rollout._replace(batch=batch))
+			elapsed = time.perf_counter() - start
+			move = cl.convert_to_uci_move(move) if problem is game else str(move)
+			print(f"{name:<16} batch {batch:<4}       {move:<6}  {elapsed:7.2f}s  {playouts / elapsed:>8.0f} playouts/s")
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Compare the nodes the search variants need to reach a depth.")
+	parser.add_argument('--fen', help="position to search instead of the reference positions")
+	parser.add_argument('--depth', type=int, default=4, help="depth to search to")
+	parser.add_argument('--search', action='append', choices=list(SEARCHES),
+		help="search variant to run (repeat for several; default all)")
+	parser.add_argument('--match', nargs=2, choices=list(SEARCHES), metavar='SEARCH',
+		help="play two variants against each other instead")
+	parser.add_argument('--games', type=int, default=10, help="number of games in a match")
+	parser.add_argument('--smp', action='store_true', help="measure Lazy SMP scaling instead")
+	parser.add_argument('--time', type=float, help="print the iterations finished in this many seconds instead")
+	parser.add_argument('--mcts', type=int, metavar='PLAYOUTS',
+		help="measure Monte Carlo tree search scaling with this many playouts instead")
+	args = parser.parse_args(argv)
+	if args.depth < 1:
+		parser.error("depth must be at least 1")
+
+	if args.match:
+		match(*args.match, args.games, args.depth)
+		return 0
+
+	positions = [('position', args.fen)] if args.fen else [(name, fen) for name, fen, _ in REFERENCE_POSITIONS]
+	if args.smp:
+		smp_scaling(positions, args.depth)
+		return 0
+	if args.time is not None:
+		stream(positions, args.time)
+		return 0
+	if args.mcts is not None:
+		mcts_scaling(positions, args.mcts)
+		return 0
+
+	searches = args.search or list(SEARCHES)
+	totals = {search: 0 for search in searches}
+	times = {search: 0 for search in searches}
+	for name, fen in positions:
+		for search in searches:
+			move, stats = run(search, fen, args.depth)
+			totals[search] += stats.nodes
+			times[search] += stats.elapsed
+			report(name, search, move, stats)
+	for search in searches:
+		print(f"{'total':<16} {search:<20} nodes {totals[search]:>9}  {times[search]:7.2f}s")
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())